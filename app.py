@@ -1,18 +1,87 @@
-from flask import Flask, request, jsonify
-from transformers import CLIPProcessor, CLIPModel
-from PIL import Image
-import torch
-import torch.nn.functional as F
-import io
+from flask import Flask, Response, request, jsonify, g
+import numpy as np
 import base64
+import logging
+import time
+import config
+import metrics
+from batcher import MicroBatcher
+from clip_engine import load_engine
+from preprocess import ImagePreprocessor
+from startup import Startup
+
+metrics.setup_logging()
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch16")
-clip_proc = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch16")
-clip_model.eval()
+engine = None
+
+# Created first: the pool forks its workers before any thread is started
+preprocessor = ImagePreprocessor(config.PREPROCESS_WORKERS)
+
+def load_model():
+    global engine
+    model = load_engine()
+    if config.MODEL_WARMUP:
+        model.warmup()
+    engine = model
+
+# The server starts answering right away; the model loads in the background
+# and embedding routes return 503 until it is warm (see /ready).
+startup = Startup("embed-startup")
+startup.start({"model": load_model})
+
+@app.before_request
+def require_ready():
+    g.start = time.perf_counter()
+    g.stats = metrics.begin_request()
+    if request.endpoint not in ("ready", "metrics") and not startup.ready:
+        return jsonify({"error": "Model is loading.", **startup.status()}), 503
+
+@app.after_request
+def record_request(response):
+    if "start" in g:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.start, request.endpoint or "other")
+        if g.stats.spans:
+            response.headers["Server-Timing"] = metrics.server_timing(g.stats)
+    return response
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    return jsonify(startup.status()), 200 if startup.ready else 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@metrics.timed("inference")
+def embed_texts(texts: list[str]) -> np.ndarray:
+    return engine.embed_texts(texts)
+
+@metrics.timed("inference")
+def embed_pixels(pixels) -> np.ndarray:
+    return engine.embed_pixels(np.stack(pixels))
+
+def embed_image(image: bytes) -> np.ndarray:
+    """Preprocesses in the pool, then queues the pixels for the model."""
+    with metrics.span("preprocess"):
+        pixels = preprocessor.submit(image).result()
+    return image_batcher(pixels)
 
-def normalize_embedding(tensor):
-    return F.normalize(tensor, p=2, dim=-1)
+def _chunked(fn, items) -> np.ndarray:
+    parts = [fn(items[i:i + config.EMBED_MAX_BATCH])
+             for i in range(0, len(items), config.EMBED_MAX_BATCH)]
+    return np.concatenate(parts) if parts else np.empty((0, config.EMBED_DIM), np.float32)
+
+def _f32_response(arr: np.ndarray) -> Response:
+    resp = Response(np.ascontiguousarray(arr, dtype=np.float32).tobytes(),
+                    mimetype="application/octet-stream")
+    resp.headers["X-Embedding-Dim"] = str(arr.shape[-1])
+    return resp
+
+text_batcher = MicroBatcher(embed_texts, config.EMBED_MAX_BATCH, config.EMBED_MAX_WAIT_MS, name="text-batcher")
+image_batcher = MicroBatcher(embed_pixels, config.EMBED_MAX_BATCH, config.EMBED_MAX_WAIT_MS, name="image-batcher",
+                             max_queue=config.PREPROCESS_QUEUE)
 
 @app.route("/embed", methods=["POST"])
 def embed():
@@ -20,29 +89,58 @@ def embed():
     result = []
 
     if 'text' in data:
-        text_emb = clip_model.get_text_features(
-            **clip_proc(text=[data['text']], return_tensors="pt")
-        )
-        text_emb = normalize_embedding(text_emb)  # ✅ Normalize
-        text_emb = text_emb[0].detach().cpu().numpy().astype('float32').tolist()
-        print(f"[INFO] Text embedding dimension: {len(text_emb)} (normalized)")
-        result.append(text_emb)
+        text_emb = text_batcher(data['text'])
+        log.debug("Text embedding dimension: %d (normalized)", len(text_emb))
+        result.append(text_emb.tolist())
 
     elif 'image' in data:
         image_data = base64.b64decode(data['image'])
-        image = Image.open(io.BytesIO(image_data)).convert('RGB')
-        img_emb = clip_model.get_image_features(
-            **clip_proc(images=image, return_tensors="pt")
-        )
-        img_emb = normalize_embedding(img_emb)  # ✅ Normalize
-        img_emb = img_emb[0].detach().cpu().numpy().astype('float32').tolist()
-        print(f"[INFO] Image embedding dimension: {len(img_emb)} (normalized)")
-        result.append(img_emb)
+        img_emb = embed_image(image_data)
+        log.debug("Image embedding dimension: %d (normalized)", len(img_emb))
+        result.append(img_emb.tolist())
 
     else:
         return jsonify({"error": "Specify 'text' or 'image'."}), 400
 
     return jsonify(result)
 
+@app.route("/embed_raw", methods=["POST"])
+def embed_raw():
+    """Binary variant of /embed: the body is the raw UTF-8 text or image file,
+    the response is the float32 vector as little-endian bytes."""
+    mtype = request.args.get("type", "text")
+    body = request.get_data()
+    if not body:
+        return jsonify({"error": "Empty body."}), 400
+
+    if mtype == "text":
+        emb = text_batcher(body.decode("utf-8"))
+    elif mtype in ("image", "audio"):
+        emb = embed_image(body)
+    else:
+        return jsonify({"error": "Specify type=text or type=image."}), 400
+
+    return _f32_response(emb)
+
+@app.route("/embed_batch", methods=["POST"])
+def embed_batch():
+    data = request.get_json()
+    texts = data.get('texts') or []
+    images = data.get('images') or []
+    if not texts and not images:
+        return jsonify({"error": "Specify 'texts' and/or 'images'."}), 400
+
+    text_embs = _chunked(embed_texts, texts)
+    with metrics.span("preprocess"):
+        pixels = preprocessor.map([base64.b64decode(b) for b in images])
+    image_embs = _chunked(embed_pixels, pixels)
+    metrics.BATCH_SIZE.observe(len(texts) + len(images), "embed_batch")
+    log.debug("Batch embedded %d texts, %d images", len(texts), len(images))
+
+    # format=f32 returns texts then images as one contiguous float32 matrix
+    if request.args.get("format") == "f32":
+        return _f32_response(np.concatenate([text_embs, image_embs]))
+    return jsonify({"texts": text_embs.tolist(), "images": image_embs.tolist()})
+
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8009)
+    app.run(host="0.0.0.0", port=8009, threaded=True)
@@ -0,0 +1,49 @@
+"""
+Ingest throughput: serial /submit vs /submit_batch over synthetic text
+items. Needs main.py and the embedding service running.
+
+    python -m bench.bulk_ingest --items 10000 --batch-size 256 --serial-items 500
+"""
+import argparse
+import json
+import uuid
+
+import requests
+
+from bench.common import Timer, sample_texts
+
+MAIN_URL = "http://127.0.0.1:8000"
+
+
+def unique_texts(n):
+    # A run-specific suffix keeps re-runs from hitting the duplicate check
+    run_id = uuid.uuid4().hex[:8]
+    return [f"{t} {run_id}-{i}" for i, t in enumerate(sample_texts(n))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--serial-items", type=int, default=500)
+    args = parser.parse_args()
+
+    with requests.Session() as session:
+        texts = unique_texts(args.serial_items)
+        with Timer() as t:
+            for text in texts:
+                session.post(f"{MAIN_URL}/submit", data={"type": "text", "data": text}).raise_for_status()
+        print(json.dumps({"mode": "serial /submit", "items": len(texts),
+                          "items_per_sec": round(len(texts) / t.elapsed, 1)}))
+
+        texts = unique_texts(args.items)
+        with Timer() as t:
+            for i in range(0, len(texts), args.batch_size):
+                chunk = texts[i:i + args.batch_size]
+                session.post(f"{MAIN_URL}/submit_batch", data=[("data", x) for x in chunk]).raise_for_status()
+        print(json.dumps({"mode": "/submit_batch", "items": len(texts), "batch_size": args.batch_size,
+                          "items_per_sec": round(len(texts) / t.elapsed, 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import resource
+import time
+import numpy as np
+
+
+def percentiles(samples: list[float], ps=(50, 95, 99)) -> dict:
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {f"p{p}": None for p in ps}
+    arr = np.asarray(samples) * 1000.0
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in ps}
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (peak RSS where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def sample_texts(n: int) -> list[str]:
+    words = ["red", "fox", "ocean", "city", "night", "forest", "coffee", "rain",
+             "mountain", "light", "ancient", "quiet", "river", "storm", "garden"]
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(words, size=6)) for _ in range(n)]
@@ -0,0 +1,64 @@
+"""
+Per-query embedding latency for each vec.py backend, plus the legacy
+JSON/base64 /embed path for comparison. The remote rows need app.py running.
+
+    python -m bench.embed_backends --queries 200 --image path/to/file.jpg
+"""
+import argparse
+import base64
+import json
+
+import requests
+
+import config
+import vec
+from bench.common import Timer, percentiles, sample_texts
+
+
+def run(name, fn, items):
+    fn(items[0])  # warm-up
+    samples = []
+    for item in items:
+        with Timer() as t:
+            fn(item)
+        samples.append(t.elapsed)
+    return {"backend": name, "queries": len(items), **percentiles(samples)}
+
+
+def legacy_json(session):
+    def call(payload):
+        response = session.post(f"{config.EMBED_URL}/embed", json=payload)
+        response.raise_for_status()
+        return response.json()[0]
+    return call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--image", help="optional image file for image-path latency")
+    parser.add_argument("--backends", default="legacy,remote,local")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.queries)
+    image = open(args.image, "rb").read() if args.image else None
+    rows = []
+    for name in args.backends.split(","):
+        if name == "legacy":
+            call = legacy_json(requests.Session())
+            rows.append(run("legacy-json/text", lambda t: call({"text": t}), texts))
+            if image:
+                b64 = base64.b64encode(image).decode()
+                rows.append(run("legacy-json/image", lambda _: call({"image": b64}), texts))
+            continue
+        backend = vec.BACKENDS[name]()
+        rows.append(run(f"{name}/text", backend.embed_text, texts))
+        if image:
+            rows.append(run(f"{name}/image", lambda _: backend.embed_image(image), texts))
+
+    for row in rows:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
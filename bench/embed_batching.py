@@ -0,0 +1,60 @@
+"""
+Items/sec of the CLIP text embedder at different batch sizes and
+micro-batching wait windows.
+
+    python -m bench.embed_batching --items 512 --clients 32
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from batcher import MicroBatcher
+from bench.common import Timer, sample_texts
+
+
+def bench_direct(texts, batch_sizes):
+    rows = []
+    for bs in batch_sizes:
+        with Timer() as t:
+            for i in range(0, len(texts), bs):
+                app.embed_texts(texts[i:i + bs])
+        rows.append({"mode": "direct", "batch_size": bs,
+                     "items_per_sec": round(len(texts) / t.elapsed, 1)})
+    return rows
+
+
+def bench_batcher(texts, batch_sizes, waits, clients):
+    rows = []
+    for bs in batch_sizes:
+        for wait in waits:
+            batcher = MicroBatcher(app.embed_texts, max_batch=bs, max_wait_ms=wait)
+            with ThreadPoolExecutor(max_workers=clients) as pool, Timer() as t:
+                list(pool.map(batcher, texts))
+            rows.append({"mode": "micro-batch", "batch_size": bs, "wait_ms": wait,
+                         "clients": clients,
+                         "items_per_sec": round(len(texts) / t.elapsed, 1)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--batch-sizes", default="1,4,8,16,32")
+    parser.add_argument("--waits", default="0,2,5,10")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.items)
+    batch_sizes = [int(x) for x in args.batch_sizes.split(",")]
+    waits = [float(x) for x in args.waits.split(",")]
+
+    app.startup.wait()  # model loads in the background
+    app.embed_texts(texts[:8])  # warm-up
+    rows = bench_direct(texts, batch_sizes) + bench_batcher(texts, batch_sizes, waits, args.clients)
+    for row in rows:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory, build time and traversal speed of CompactGraph vs NetworkX on a
+random graph with `doc:<sha256>`-style node names. Traversal is measured
+two ways: the NetworkX idiom (neighbors + get_edge_data per edge) and
+graph_export.weighted_neighbors, which search expansion uses. Memory is
+measured on a separate build, since tracemalloc slows allocation-heavy
+code unevenly and would skew the build times.
+
+    python -m bench.graph_memory --nodes 200000 --degree 10
+"""
+import argparse
+import gc
+import hashlib
+import json
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+from bench.common import Timer
+from compact_graph import CompactGraph
+from graph_export import weighted_neighbors
+
+
+def random_edges(nodes, degree, rng):
+    names = [f"doc:{hashlib.sha256(str(i).encode()).hexdigest()}" for i in range(nodes)]
+    src = np.repeat(np.arange(nodes), degree // 2)
+    dst = rng.integers(0, nodes, size=len(src))
+    scores = rng.random(len(src)).astype(np.float32)
+    return names, list(zip(src.tolist(), dst.tolist(), scores.tolist()))
+
+
+def build(kind, names, edges):
+    graph = CompactGraph() if kind == "compact" else nx.Graph()
+    for name in names:
+        graph.add_node(name)
+    for u, v, score in edges:
+        if u != v:
+            graph.add_edge(names[u], names[v], score=score)
+    if kind == "compact":
+        graph.merge()
+    return graph
+
+
+def traverse(graph, seeds):
+    total = 0.0
+    for node in seeds:
+        for nbr in graph.neighbors(node):
+            total += graph.get_edge_data(node, nbr)["score"]
+    return total
+
+
+def traverse_weighted(graph, seeds):
+    total = 0.0
+    for node in seeds:
+        for _, score in weighted_neighbors(graph, node):
+            total += score
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--degree", type=int, default=10)
+    parser.add_argument("--seeds", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    names, edges = random_edges(args.nodes, args.degree, rng)
+    seeds = [names[i] for i in rng.integers(0, args.nodes, size=args.seeds)]
+
+    for kind in ("networkx", "compact"):
+        gc.collect()
+        tracemalloc.start()
+        graph = build(kind, names, edges)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del graph
+        gc.collect()
+        with Timer() as build_t:
+            graph = build(kind, names, edges)
+        with Timer() as trav_t:
+            traverse(graph, seeds)
+        with Timer() as weighted_t:
+            traverse_weighted(graph, seeds)
+        print(json.dumps({
+            "graph": kind,
+            "nodes": graph.number_of_nodes(),
+            "edges": graph.number_of_edges(),
+            "memory_mb": round(current / 2**20, 1),
+            "build_sec": round(build_t.elapsed, 2),
+            "traverse_nodes_per_sec": round(len(seeds) / trav_t.elapsed, 1),
+            "weighted_neighbors_nodes_per_sec": round(len(seeds) / weighted_t.elapsed, 1),
+        }))
+        del graph
+
+
+if __name__ == "__main__":
+    main()
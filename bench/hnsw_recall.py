@@ -0,0 +1,98 @@
+"""
+recall@k vs latency for HNSW at several EF_RUNTIME values, with a FLAT index
+over the same synthetic vectors as ground truth. Uses its own key prefix and
+indexes, and drops them afterwards. Needs Redis with RediSearch.
+
+    python -m bench.hnsw_recall --docs 100000 --queries 200 --k 10
+"""
+import argparse
+import json
+
+import numpy as np
+import redis
+from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+import db
+from bench.common import Timer, percentiles
+
+PREFIX = "bench:hnsw:"
+
+
+def random_unit(n, dim, rng):
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def load(r, vectors, batch=1000):
+    for start in range(0, len(vectors), batch):
+        pipe = r.pipeline(transaction=False)
+        for i in range(start, min(start + batch, len(vectors))):
+            pipe.hset(f"{PREFIX}{i}", mapping={"embedding": vectors[i].tobytes(), "data": str(i), "type": "text"})
+        pipe.execute()
+
+
+def knn(r, index, q, k, ef=None):
+    ef_clause = " EF_RUNTIME $ef" if ef else ""
+    params = {"vector": q.tobytes()}
+    if ef:
+        params["ef"] = ef
+    query = (Query(f"*=>[KNN {k} @embedding $vector{ef_clause} AS vector_score]")
+             .sort_by("vector_score").return_fields("vector_score").dialect(2))
+    return [doc.id for doc in r.ft(index).search(query, query_params=params).docs]
+
+
+def run(r, index, queries, k, ef=None):
+    samples, ids = [], []
+    for q in queries:
+        with Timer() as t:
+            ids.append(knn(r, index, q, k, ef))
+        samples.append(t.elapsed)
+    return ids, samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-runtime", default="10,20,50,100,200")
+    args = parser.parse_args()
+
+    r = redis.Redis(host="localhost", port=6379)
+    rng = np.random.default_rng(0)
+    load(r, random_unit(args.docs, args.dim, rng))
+    queries = random_unit(args.queries, args.dim, rng)
+
+    definition = IndexDefinition(prefix=[PREFIX], index_type=IndexType.HASH)
+    indexes = {"FLAT": "bench:idx:flat", "HNSW": "bench:idx:hnsw"}
+    params = {"HNSW": {"m": args.m, "ef_construction": args.ef_construction, "storage": "float32"},
+              "FLAT": {"storage": "float32"}}
+    try:
+        for algo, name in indexes.items():
+            r.ft(name).create_index(db.index_schema(args.dim, algo, **params[algo]), definition=definition)
+            db.wait_for_indexing(r, name)
+
+        truth, flat_samples = run(r, indexes["FLAT"], queries, args.k)
+        print(json.dumps({"index": "FLAT", "recall": 1.0, **percentiles(flat_samples)}))
+
+        for ef in (int(x) for x in args.ef_runtime.split(",")):
+            found, samples = run(r, indexes["HNSW"], queries, args.k, ef)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, truth)])
+            print(json.dumps({"index": "HNSW", "ef_runtime": ef, "recall": round(float(recall), 4),
+                              **percentiles(samples)}))
+    finally:
+        for name in indexes.values():
+            try:
+                r.ft(name).dropindex(delete_documents=False)
+            except redis.ResponseError:
+                pass
+        for start in range(0, args.docs, 1000):
+            r.delete(*[f"{PREFIX}{i}" for i in range(start, min(start + 1000, args.docs))])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Images/sec of image preprocessing: CLIPProcessor on full decodes (the old
+inline path) vs preprocess.ImagePreprocessor (draft-mode JPEG decode) with
+different worker counts, plus the pixel difference between the two.
+
+    python -m bench.image_preprocess --images 256 --workers 0,2,4 --image big.jpg
+"""
+import argparse
+import io
+import json
+
+import numpy as np
+from PIL import Image
+from transformers import CLIPProcessor
+
+import config
+from bench.common import Timer
+from preprocess import ImagePreprocessor
+
+
+def sample_jpegs(paths, n, size=(3000, 4000)):
+    if paths:
+        files = [open(p, "rb").read() for p in paths]
+        return [files[i % len(files)] for i in range(n)]
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(base).resize((size[1], size[0])).save(buf, format="JPEG", quality=90)
+    return [buf.getvalue()] * n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=128)
+    parser.add_argument("--workers", default="0,2,4")
+    parser.add_argument("--image", action="append", default=[], help="JPEG file (repeatable); synthetic 12MP otherwise")
+    args = parser.parse_args()
+
+    images = sample_jpegs(args.image, args.images)
+    proc = CLIPProcessor.from_pretrained(config.CLIP_MODEL_NAME)
+
+    def inline(batch):
+        pil = [Image.open(io.BytesIO(b)).convert("RGB") for b in batch]
+        return proc(images=pil, return_tensors="np")["pixel_values"]
+
+    with Timer() as t:
+        reference = np.concatenate([inline(images[i:i + 32]) for i in range(0, len(images), 32)])
+    print(json.dumps({"mode": "clip-processor", "images_per_sec": round(len(images) / t.elapsed, 1)}))
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        pre = ImagePreprocessor(workers)
+        with Timer() as t:
+            pixels = pre.map(images)
+        pre.close()
+        print(json.dumps({"mode": "draft-pool", "workers": workers,
+                          "images_per_sec": round(len(images) / t.elapsed, 1),
+                          "max_abs_diff": round(float(np.abs(pixels - reference).max()), 4)}))
+
+
+if __name__ == "__main__":
+    main()
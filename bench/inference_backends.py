@@ -0,0 +1,74 @@
+"""
+Parity and throughput of the CLIP inference backends: eager PyTorch fp32,
+ONNX Runtime fp32 and ONNX Runtime dynamic int8. Parity is the cosine
+similarity of each backend's embeddings against PyTorch for the same inputs.
+
+    python -m bench.inference_backends --batch 16 --rounds 20 --image a.jpg --image b.jpg
+"""
+import argparse
+import io
+import json
+
+import numpy as np
+from PIL import Image
+
+from bench.common import Timer, percentiles, sample_texts
+from clip_engine import ClipEngine
+from onnx_engine import OnnxClipEngine
+
+
+def sample_images(paths: list[str], n: int) -> list[bytes]:
+    if paths:
+        files = [open(p, "rb").read() for p in paths]
+        return [files[i % len(files)] for i in range(n)]
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(n):
+        buf = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)).save(buf, format="JPEG")
+        images.append(buf.getvalue())
+    return images
+
+
+def throughput(fn, batch, rounds):
+    fn(batch)  # warm-up
+    samples = []
+    for _ in range(rounds):
+        with Timer() as t:
+            fn(batch)
+        samples.append(t.elapsed)
+    return {"items_per_s": round(len(batch) * rounds / sum(samples), 1), **percentiles(samples)}
+
+
+def parity(reference: np.ndarray, embs: np.ndarray) -> dict:
+    cos = np.sum(reference * embs, axis=1)
+    return {"cos_min": round(float(cos.min()), 5), "cos_mean": round(float(cos.mean()), 5)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--image", action="append", default=[], help="image file (repeatable); random JPEGs otherwise")
+    parser.add_argument("--intra-op", type=int, default=0)
+    parser.add_argument("--inter-op", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = sample_texts(args.batch)
+    images = sample_images(args.image, args.batch)
+    engines = {
+        "torch": ClipEngine(),
+        "onnx": OnnxClipEngine(int8=False, intra_op=args.intra_op, inter_op=args.inter_op),
+        "onnx-int8": OnnxClipEngine(int8=True, intra_op=args.intra_op, inter_op=args.inter_op),
+    }
+    reference = {"text": engines["torch"].embed_texts(texts), "image": engines["torch"].embed_images(images)}
+
+    for name, engine in engines.items():
+        for kind, fn, batch in (("text", engine.embed_texts, texts), ("image", engine.embed_images, images)):
+            row = {"backend": name, "kind": kind, "batch": args.batch,
+                   **parity(reference[kind], fn(batch)), **throughput(fn, batch, args.rounds)}
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
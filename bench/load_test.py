@@ -0,0 +1,79 @@
+"""
+Closed-loop load test for main.py: N concurrent clients issue /search (text)
+requests back to back. Reports requests/sec and p50/p95/p99 latency at each
+concurrency level. Requests bypass the result cache (cache=false), and each
+query text gets a unique suffix so it also misses the embedding cache:
+every request exercises embed + KNN + graph expansion. --reuse-queries
+sends the sampled texts as they are, which measures the warm path where
+repeated queries skip the embedder.
+
+    python -m bench.load_test --concurrency 1,16,64 --duration 20
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+
+import requests
+
+from bench.common import percentiles, sample_texts
+
+MAIN_URL = "http://127.0.0.1:8000"
+# Per-run token plus a request counter shared by all clients and levels, so
+# no suffix repeats, not even against a Redis cache left by an earlier run
+RUN_ID = uuid.uuid4().hex[:8]
+REQUEST_IDS = itertools.count()
+
+
+def client(queries, offset, deadline, samples, errors, unique=True):
+    with requests.Session() as session:
+        i = offset
+        while time.perf_counter() < deadline:
+            query = queries[i % len(queries)]
+            if unique:
+                # Different text, different embedding cache key
+                query = f"{query} {RUN_ID}-{next(REQUEST_IDS)}"
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{MAIN_URL}/search",
+                                        data={"type": "text", "query": query, "cache": "false"}, timeout=60)
+                response.raise_for_status()
+                samples.append(time.perf_counter() - start)
+            except requests.exceptions.RequestException:
+                errors.append(1)
+            i += 1
+
+
+def run_level(concurrency, duration, queries, unique=True):
+    samples, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(queries, n * 7, deadline, samples, errors, unique))
+               for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": len(samples), "errors": len(errors),
+            "rps": round(len(samples) / elapsed, 1), **percentiles(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--distinct", type=int, default=200)
+    parser.add_argument("--reuse-queries", action="store_true",
+                        help="repeat the sampled texts, so the embedding cache answers them")
+    args = parser.parse_args()
+
+    queries = sample_texts(args.distinct)
+    for level in (int(x) for x in args.concurrency.split(",")):
+        print(json.dumps(run_level(level, args.duration, queries, not args.reuse_queries)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Offline end-to-end benchmark: no CLIP model, no internet, no app.py.
+
+For each corpus size, a synthetic corpus is loaded: random unit-norm
+vectors with text/image placeholders and a random semantic graph. The
+embedder is vec.StubBackend, which is deterministic. The suite then drives
+main.py in-process through its ASGI app (/submit, /search, /graph-data)
+and calls search_with_graph_expansion directly. Each op reports
+throughput, p50/p95/p99 latency, mean Redis round trips and RSS. Results
+are written as JSON for regression comparison.
+
+--redis fake uses fakeredis, which has no RediSearch, so KNN runs on the
+in-process vector shard. --redis redis://host:port/15 uses a real Redis.
+That database is FLUSHED before each size.
+
+    python -m bench.offline_suite --redis fake --scales 10000,100000 --out bench_offline.json
+    python -m bench.offline_suite --redis redis://localhost:6379/15 --knn redis
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import Timer, percentiles, rss_mb, sample_texts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="10000,100000,1000000")
+    parser.add_argument("--redis", default="fake", help="'fake' or a redis:// URL (database is flushed)")
+    parser.add_argument("--knn", choices=["shard", "redis"], default="shard")
+    parser.add_argument("--degree", type=int, default=10, help="average graph degree of the synthetic corpus")
+    parser.add_argument("--ops", type=int, default=200, help="requests per op and scale")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_offline.json")
+    args = parser.parse_args()
+    if args.redis == "fake" and args.knn == "redis":
+        parser.error("fakeredis has no RediSearch; use --knn shard")
+    return args
+
+
+def configure(args, tmp):
+    """Environment for main.py; must run before config is imported."""
+    os.environ.update({
+        "EMBED_BACKEND": "stub",
+        "KNN_BACKEND": args.knn,
+        "VECTOR_STORAGE": "float32",
+        "GRAPH_FILE": os.path.join(tmp, "graph.pkl"),
+        "GRAPH_LOG_FILE": os.path.join(tmp, "graph.log"),
+        "SHARD_PATH": os.path.join(tmp, "vectors", "docs"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+
+async def open_redis(args):
+    import db
+    if args.redis == "fake":
+        import fakeredis
+        fake = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+        return db.CountingRedis(connection_pool=fake.connection_pool)
+    r = db.CountingRedis.from_url(args.redis)
+    await r.flushdb()
+    if args.knn == "redis":
+        import redis
+        db.create_index(redis.Redis.from_url(args.redis), 512)
+    return r
+
+
+def random_unit(n, dim, rng):
+    v = rng.standard_normal((n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+async def seed_corpus(r, shard, n, degree, rng, chunk=5000):
+    """Loads n synthetic docs through db.storeVecBatch and returns the node
+    names plus a random CompactGraph over them."""
+    import db
+    from compact_graph import CompactGraph
+
+    names = [f"doc:{hashlib.sha256(str(i).encode()).hexdigest()}" for i in range(n)]
+    is_text = rng.random(n) < 0.7
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        vectors = random_unit(end - start, 512, rng)
+        items = [(names[i], vectors[i - start],
+                  f"synthetic document {i}" if is_text[i] else f"synthetic_{i}.jpg",
+                  "text" if is_text[i] else "image") for i in range(start, end)]
+        await db.storeVecBatch(items, r, shard)
+
+    us = np.repeat(np.arange(n), max(1, degree // 2))
+    vs = rng.integers(0, n, size=len(us))
+    scores = rng.uniform(0.5, 1.0, size=len(us))
+    return names, CompactGraph.from_arrays(names, us, vs, scores)
+
+
+def install(main, r, shard, store):
+    """Points main.py's module state at this scale's Redis, shard and graph."""
+    from cache import EmbeddingCache, ResultCache
+    from dedup import NearDuplicateIndex
+    main.r = r
+    main.embedding_cache = EmbeddingCache(r)
+    main.result_cache = ResultCache(r)
+    if main.near_dups is not None:
+        main.near_dups = NearDuplicateIndex(r)
+    main.vector_shard = shard
+    main.graph_store = store
+    main.semantic_graph = store.graph
+
+
+async def run_op(scale, name, call, count):
+    import metrics
+    round_trips = metrics.REDIS_ROUND_TRIPS.value()
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        with Timer() as t:
+            await call(i)
+        samples.append(t.elapsed)
+    elapsed = time.perf_counter() - start
+    return {"scale": scale, "op": name, "count": count,
+            "ops_per_s": round(count / elapsed, 1), **percentiles(samples),
+            "redis_round_trips": round((metrics.REDIS_ROUND_TRIPS.value() - round_trips) / count, 2),
+            "rss_mb": round(rss_mb(), 1)}
+
+
+async def bench_scale(args, main, client, scale, tmp):
+    import config
+    import search
+    from graph_rank import GraphRank
+    from graph_store import GraphStore
+    from shard import VectorShard
+
+    rng = np.random.default_rng(args.seed)
+    r = await open_redis(args)
+    shard = VectorShard(os.path.join(tmp, f"shard_{scale}"), 512) if args.knn == "shard" else None
+    store = GraphStore(os.path.join(tmp, f"graph_{scale}.pkl"), os.path.join(tmp, f"graph_{scale}.log"))
+
+    with Timer() as t:
+        names, store.graph = await seed_corpus(r, shard, scale, args.degree, rng)
+    if args.redis != "fake" and args.knn == "redis":
+        import db
+        import redis
+        db.wait_for_indexing(redis.Redis.from_url(args.redis), config.INDEX_ALIAS)
+    rows = [{"scale": scale, "op": "seed", "count": scale, "seconds": round(t.elapsed, 2),
+             "ops_per_s": round(scale / t.elapsed, 1), "rss_mb": round(rss_mb(), 1)}]
+    install(main, r, shard, store)
+    main.graph_rank = None
+    if config.RANK_WEIGHT > 0:
+        # Unpersonalized: node types would come from the service's Redis
+        main.graph_rank = GraphRank(store)
+        with Timer() as t:
+            main.graph_rank.refresh()
+        rows.append({"scale": scale, "op": "rank_refresh", "count": 1, "seconds": round(t.elapsed, 2),
+                     "rss_mb": round(rss_mb(), 1)})
+
+    queries = sample_texts(args.ops)
+    page = 500
+
+    async def submit(i):
+        response = await client.post("/submit", data={"type": "text", "data": f"bench submit {scale} {i}"})
+        response.raise_for_status()
+
+    async def search_(i):
+        response = await client.post("/search", data={"type": "text", "query": f"{queries[i]} {i}",
+                                                       "top_k": args.top_k, "depth": args.depth,
+                                                       "cache": "false"})
+        response.raise_for_status()
+
+    async def graph_data(i):
+        cursor = int(rng.integers(0, max(1, scale - page)))
+        response = await client.get("/graph-data", params={"cursor": cursor, "limit": page})
+        response.raise_for_status()
+
+    async def expansion(i):
+        seeds = rng.choice(len(names), size=args.top_k // 2, replace=False)
+        initial = [{"id": names[j], "score": float(s)} for j, s in zip(seeds, rng.uniform(0.6, 1.0, len(seeds)))]
+        await search.search_with_graph_expansion(initial, main.semantic_graph, r, k=args.top_k, depth=args.depth,
+                                                 priors=main.graph_rank)
+
+    for op, call in (("submit", submit), ("search", search_), ("graph-data", graph_data),
+                     ("expansion", expansion)):
+        rows.append(await run_op(scale, op, call, args.ops))
+
+    store.close()
+    if shard is not None:
+        shard.close()
+    await r.aclose()
+    return rows
+
+
+async def run(args, tmp):
+    import httpx
+    import main
+
+    main.startup.start({})  # module state is installed per scale below
+    main.startup.wait()
+    transport = httpx.ASGITransport(app=main.app)
+    rows = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scale in (int(s) for s in args.scales.split(",")):
+            for row in await bench_scale(args, main, client, scale, tmp):
+                print(json.dumps(row))
+                rows.append(row)
+    return rows
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(args, tmp)
+        rows = asyncio.run(run(args, tmp))
+
+    report = {
+        "meta": {"redis": "fake" if args.redis == "fake" else "redis", "knn_backend": args.knn,
+                 "degree": args.degree, "ops": args.ops, "top_k": args.top_k, "depth": args.depth,
+                 "seed": args.seed, "python": sys.version.split()[0], "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": rows,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Memory, QPS and recall@k of FLOAT32 vs FLOAT16 vs INT8 vector storage, with
+and without exact re-ranking of RERANK_FACTOR x k candidates. Ground truth is
+a NumPy brute-force search over the float32 vectors. Uses its own key prefix
+and indexes and removes them afterwards. INT8 needs Redis 8.
+
+    python -m bench.quantization --docs 100000 --queries 200
+"""
+import argparse
+import json
+
+import numpy as np
+import redis
+from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+import db
+import quantize
+from bench.common import Timer
+
+PREFIX = "bench:q:"
+
+
+def random_unit(n, dim, rng):
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def load(r, storage, vectors, batch=1000):
+    for start in range(0, len(vectors), batch):
+        pipe = r.pipeline(transaction=False)
+        for i in range(start, min(start + batch, len(vectors))):
+            pipe.hset(f"{PREFIX}{storage}:{i}", mapping={**quantize.encode(vectors[i], storage),
+                                                         "data": str(i), "type": "text"})
+        pipe.execute()
+
+
+def knn_ids(r, index, q, fetch, storage):
+    query = (Query(f"*=>[KNN {fetch} @embedding $vector AS vector_score]")
+             .sort_by("vector_score").return_fields("vector_score").paging(0, fetch).dialect(2))
+    docs = r.ft(index).search(query, query_params={"vector": quantize.query_bytes(q, storage)}).docs
+    return [int(doc.id.rsplit(":", 1)[1]) for doc in docs]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--storages", default="float32,float16,int8")
+    args = parser.parse_args()
+
+    r = redis.Redis(host="localhost", port=6379)
+    rng = np.random.default_rng(0)
+    vectors = random_unit(args.docs, args.dim, rng)
+    queries = random_unit(args.queries, args.dim, rng)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+
+    for storage in args.storages.split(","):
+        index = f"bench:idx:q:{storage}"
+        load(r, storage, vectors)
+        definition = IndexDefinition(prefix=[f"{PREFIX}{storage}:"], index_type=IndexType.HASH)
+        try:
+            r.ft(index).create_index(db.index_schema(args.dim, "FLAT", storage=storage), definition=definition)
+            db.wait_for_indexing(r, index)
+            info = r.ft(index).info()
+            vector_mb = float(info.get("vector_index_sz_mb", 0))
+
+            for factor in sorted({1, args.rerank_factor}):
+                hits = 0
+                with Timer() as t:
+                    for qi, q in enumerate(queries):
+                        ids = knn_ids(r, index, q, args.k * factor, storage)
+                        if factor > 1:
+                            ids = [ids[j] for j in np.argsort(-(vectors[ids] @ q))[:args.k]]
+                        hits += len(set(ids[:args.k]) & set(truth[qi].tolist()))
+                print(json.dumps({
+                    "storage": storage,
+                    "rerank_factor": factor,
+                    "vector_index_mb_per_million": round(vector_mb * 1e6 / args.docs, 1),
+                    "qps": round(len(queries) / t.elapsed, 1),
+                    f"recall@{args.k}": round(hits / (len(queries) * args.k), 4),
+                }))
+        finally:
+            try:
+                r.ft(index).dropindex(delete_documents=False)
+            except redis.ResponseError:
+                pass
+            for start in range(0, args.docs, 1000):
+                r.delete(*[f"{PREFIX}{storage}:{i}" for i in range(start, min(start + 1000, args.docs))])
+
+
+if __name__ == "__main__":
+    main()
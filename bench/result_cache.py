@@ -0,0 +1,55 @@
+"""
+p50/p99 /search latency with and without the result cache, using a skewed
+(Zipf) mix of repeated text queries. Needs main.py running on MAIN_URL.
+
+    python -m bench.result_cache --queries 1000 --distinct 50
+"""
+import argparse
+import json
+
+import numpy as np
+import requests
+
+from bench.common import Timer, percentiles, sample_texts
+
+MAIN_URL = "http://127.0.0.1:8000"
+
+
+def run(session, queries, use_cache):
+    samples = []
+    for q in queries:
+        with Timer() as t:
+            response = session.post(f"{MAIN_URL}/search",
+                                    data={"type": "text", "query": q, "cache": str(use_cache).lower()})
+            response.raise_for_status()
+        samples.append(t.elapsed)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--zipf", type=float, default=1.2)
+    args = parser.parse_args()
+
+    pool = sample_texts(args.distinct)
+    rng = np.random.default_rng(1)
+    picks = np.minimum(rng.zipf(args.zipf, size=args.queries), args.distinct) - 1
+    queries = [pool[i] for i in picks]
+
+    with requests.Session() as session:
+        before = session.get(f"{MAIN_URL}/cache/stats").json()["result_cache"]
+        uncached = run(session, queries, use_cache=False)
+        cached = run(session, queries, use_cache=True)
+        after = session.get(f"{MAIN_URL}/cache/stats").json()["result_cache"]
+
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    print(json.dumps({"mode": "no-cache", **percentiles(uncached, (50, 99))}))
+    print(json.dumps({"mode": "cache", **percentiles(cached, (50, 99)),
+                      "hit_rate": round(hits / max(hits + misses, 1), 3)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Head-to-head KNN latency: RediSearch FLAT index vs the in-process
+memory-mapped VectorShard, on the same synthetic vectors. Shard rows are
+also timed with several queries per matrix product. Uses its own Redis key
+prefix and a temporary shard directory.
+
+    python -m bench.shard_knn --docs 100000 --queries 200 --batch-sizes 1,8,32
+"""
+import argparse
+import json
+import tempfile
+import os
+
+import numpy as np
+import redis
+from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+import db
+from bench.common import Timer, percentiles
+from bench.quantization import random_unit
+from shard import VectorShard
+
+PREFIX = "bench:shard:"
+INDEX = "bench:idx:shard"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = random_unit(args.docs, args.dim, rng)
+    queries = random_unit(args.queries, args.dim, rng)
+    r = redis.Redis(host="localhost", port=6379)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shard = VectorShard(os.path.join(tmp, "docs"), args.dim)
+        shard.append_many([f"{PREFIX}{i}" for i in range(args.docs)], vectors, ["text"] * args.docs)
+
+        for start in range(0, args.docs, 1000):
+            pipe = r.pipeline(transaction=False)
+            for i in range(start, min(start + 1000, args.docs)):
+                pipe.hset(f"{PREFIX}{i}", mapping={"embedding": vectors[i].tobytes(), "data": str(i), "type": "text"})
+            pipe.execute()
+        definition = IndexDefinition(prefix=[PREFIX], index_type=IndexType.HASH)
+        try:
+            r.ft(INDEX).create_index(db.index_schema(args.dim, "FLAT", storage="float32"), definition=definition)
+            db.wait_for_indexing(r, INDEX)
+
+            samples = []
+            query = (Query(f"*=>[KNN {args.k} @embedding $vector AS vector_score]")
+                     .sort_by("vector_score").return_fields("vector_score").dialect(2))
+            for q in queries:
+                with Timer() as t:
+                    r.ft(INDEX).search(query, query_params={"vector": q.tobytes()})
+                samples.append(t.elapsed)
+            print(json.dumps({"backend": "redis-flat", "queries_per_call": 1, **percentiles(samples)}))
+
+            for bs in (int(x) for x in args.batch_sizes.split(",")):
+                samples = []
+                for i in range(0, len(queries), bs):
+                    with Timer() as t:
+                        shard.search(queries[i:i + bs], args.k)
+                    samples.append(t.elapsed / len(queries[i:i + bs]))
+                print(json.dumps({"backend": "shard", "queries_per_call": bs,
+                                  "per_query": percentiles(samples)}))
+        finally:
+            shard.close()
+            try:
+                r.ft(INDEX).dropindex(delete_documents=False)
+            except redis.ResponseError:
+                pass
+            for start in range(0, args.docs, 1000):
+                r.delete(*[f"{PREFIX}{i}" for i in range(start, min(start + 1000, args.docs))])
+
+
+if __name__ == "__main__":
+    main()
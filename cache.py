@@ -0,0 +1,164 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+import numpy as np
+import redis.asyncio as aioredis
+import config
+import metrics
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys. CLIP's tokenizer lowercases and
+    splits on whitespace, so these variants embed identically anyway."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """Two-tier query embedding cache.
+
+    Tier 1 is an in-process LRU bounded by the total bytes of stored vectors.
+    Tier 2 is Redis, holding raw float32 blobs under `emb:<key>` with a TTL,
+    so embeddings survive restarts and are shared between workers.
+    """
+
+    def __init__(self, r: Optional[aioredis.Redis], max_bytes: int = config.EMB_CACHE_MAX_BYTES,
+                 ttl: int = config.EMB_CACHE_TTL, prefix: str = "emb:"):
+        self.r = r
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lru: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _put_local(self, key: str, vector: np.ndarray):
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._lru[key] = vector
+            self._bytes += vector.nbytes
+            while self._bytes > self.max_bytes and self._lru:
+                _, evicted = self._lru.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    async def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.inc(1, "embedding", "hit")
+                return vector
+
+        if self.r is not None:
+            blob = await self.r.get(self.prefix + key)
+            if blob:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._put_local(key, vector)
+                self.redis_hits += 1
+                metrics.CACHE_LOOKUPS.inc(1, "embedding", "redis_hit")
+                return vector
+
+        self.misses += 1
+        metrics.CACHE_LOOKUPS.inc(1, "embedding", "miss")
+        return None
+
+    async def put(self, key: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        self._put_local(key, vector)
+        if self.r is not None:
+            await self.r.set(self.prefix + key, vector.tobytes(), ex=self.ttl)
+        return vector
+
+    async def get_or_compute(self, key: str,
+                             compute: Callable[[], Awaitable[Optional[np.ndarray]]]) -> Optional[np.ndarray]:
+        vector = await self.get(key)
+        if vector is not None:
+            return vector
+        vector = await compute()
+        if vector is None:
+            return None
+        return await self.put(key, vector)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._lru),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """Caches full search responses in Redis.
+
+    Every entry records the graph generation it was computed at. `/submit`
+    bumps the generation with INCR, so any entry written before the latest
+    ingest is treated as a miss and never served. The generation and the
+    entry are read in one pipelined round trip.
+    """
+
+    GENERATION_KEY = "graph:generation"
+
+    def __init__(self, r: aioredis.Redis, ttl: int = config.RESULT_CACHE_TTL, prefix: str = "res:"):
+        self.r = r
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def make_key(self, query_vector, top_k: int, mtype: str, depth: int, *extra) -> str:
+        digest = hashlib.sha256(np.asarray(query_vector, dtype=np.float32).tobytes()).hexdigest()
+        return ":".join([f"{self.prefix}{digest}", str(top_k), mtype, str(depth), *map(str, extra)])
+
+    async def generation(self) -> int:
+        return int(await self.r.get(self.GENERATION_KEY) or 0)
+
+    async def bump_generation(self) -> int:
+        return await self.r.incr(self.GENERATION_KEY)
+
+    async def get(self, key: str):
+        """Returns (results, generation); results is None on a miss."""
+        pipe = self.r.pipeline(transaction=False)
+        pipe.get(self.GENERATION_KEY)
+        pipe.get(key)
+        gen_raw, blob = await pipe.execute()
+        gen = int(gen_raw or 0)
+        if blob:
+            entry = json.loads(blob)
+            if entry["gen"] == gen:
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.inc(1, "result", "hit")
+                return entry["results"], gen
+            self.stale += 1
+            metrics.CACHE_LOOKUPS.inc(1, "result", "stale")
+        self.misses += 1
+        metrics.CACHE_LOOKUPS.inc(1, "result", "miss")
+        return None, gen
+
+    async def put(self, key: str, results, gen: int):
+        await self.r.set(key, json.dumps({"gen": gen, "results": results}), ex=self.ttl)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
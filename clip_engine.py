@@ -0,0 +1,87 @@
+from transformers import CLIPProcessor, CLIPModel
+from PIL import Image
+import numpy as np
+import torch
+import torch.nn.functional as F
+import argparse
+import io
+import os
+import config
+
+
+def normalize_embedding(tensor):
+    return F.normalize(tensor, p=2, dim=-1)
+
+
+def resolve_model_path(model_name: str = config.CLIP_MODEL_NAME, model_dir: str = config.CLIP_MODEL_DIR) -> str:
+    """The local pre-converted copy if one has been saved, else the hub name."""
+    if model_dir and os.path.exists(os.path.join(model_dir, "config.json")):
+        return model_dir
+    return model_name
+
+
+def warmup_image() -> bytes:
+    """A small blank PNG for warm-up batches."""
+    buf = io.BytesIO()
+    Image.new("RGB", (224, 224)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class ClipEngine:
+    """In-process CLIP encoder returning L2-normalized float32 embeddings."""
+
+    def __init__(self, model_name: str = config.CLIP_MODEL_NAME, model_dir: str = config.CLIP_MODEL_DIR):
+        self.path = resolve_model_path(model_name, model_dir)
+        self.model = CLIPModel.from_pretrained(self.path, low_cpu_mem_usage=True)
+        self.proc = CLIPProcessor.from_pretrained(self.path)
+        self.model.eval()
+
+    def warmup(self):
+        """Runs one tiny text and image batch through both towers."""
+        self.embed_texts(["warm-up"])
+        self.embed_images([warmup_image()])
+
+    def save(self, path: str = config.CLIP_MODEL_DIR):
+        """Writes model (safetensors) and processor files to `path`."""
+        self.model.save_pretrained(path, safe_serialization=True)
+        self.proc.save_pretrained(path)
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """Embeds a list of texts in one padded forward pass."""
+        with torch.inference_mode():
+            inputs = self.proc(text=texts, return_tensors="pt", padding=True, truncation=True)
+            emb = normalize_embedding(self.model.get_text_features(**inputs))
+        return emb.cpu().numpy().astype(np.float32)
+
+    def embed_images(self, images: list[bytes]) -> np.ndarray:
+        """Embeds a list of raw image files in one forward pass."""
+        pil_images = [Image.open(io.BytesIO(b)).convert('RGB') for b in images]
+        with torch.inference_mode():
+            inputs = self.proc(images=pil_images, return_tensors="pt")
+            emb = normalize_embedding(self.model.get_image_features(**inputs))
+        return emb.cpu().numpy().astype(np.float32)
+
+    def embed_pixels(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Embeds already preprocessed (n, 3, H, W) pixel_values."""
+        with torch.inference_mode():
+            emb = normalize_embedding(self.model.get_image_features(pixel_values=torch.from_numpy(pixel_values)))
+        return emb.cpu().numpy().astype(np.float32)
+
+
+def load_engine():
+    """The encoder for INFERENCE_BACKEND: eager PyTorch or ONNX Runtime."""
+    if config.INFERENCE_BACKEND == "onnx":
+        from onnx_engine import OnnxClipEngine
+        return OnnxClipEngine()
+    if config.INFERENCE_BACKEND != "torch":
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {config.INFERENCE_BACKEND}")
+    return ClipEngine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save a local safetensors copy of the CLIP model")
+    parser.add_argument("--model", default=config.CLIP_MODEL_NAME)
+    parser.add_argument("--save", default=config.CLIP_MODEL_DIR, help="output directory")
+    args = parser.parse_args()
+    ClipEngine(args.model, model_dir=None).save(args.save)
+    print(f"Saved {args.model} to {args.save}")
@@ -0,0 +1,307 @@
+from itertools import chain
+import numpy as np
+import networkx as nx
+
+
+class CompactGraph:
+    """Undirected weighted graph stored as CSR arrays.
+
+    Node names (`doc:<sha256>`) are interned to int32 ids. Adjacency lives in
+    three flat arrays (indptr, neighbor ids, float32 scores) with each row
+    sorted by neighbor id. New edges go into a small dict-of-dicts delta
+    buffer first, which is merged into the CSR arrays once it grows past a
+    fraction of the graph. Removed edges sit in the delta as None tombstones
+    until the next merge. `neighbors` and `get_edge_data` share one decoded
+    row, cached until the next write, so the NetworkX idiom of looking up
+    each neighbor's edge costs a dict lookup per edge.
+
+    Writers are serialized by the caller (GraphStore.lock), but readers such
+    as search take no lock. The CSR arrays and the delta they pair with are
+    therefore published together as one `_state` tuple. A merge builds new
+    arrays off to the side and swaps them in with a single assignment, and
+    every read works from one `_state` it fetched at the start.
+
+    Exposes the subset of the NetworkX Graph API the rest of the code uses:
+    add_node, add_edge, remove_edge, neighbors, get_edge_data, has_edge,
+    `in`, nodes, edges, degree, number_of_nodes and number_of_edges.
+    """
+
+    def __init__(self, merge_fraction: float = 0.1, min_merge: int = 4096):
+        self._ids: dict[str, int] = {}
+        self._names: list[str] = []
+        # (indptr, indices, scores, delta: {row: {col: score or None}})
+        self._state = (np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                       np.empty(0, dtype=np.float32), {})
+        self._delta_size = 0
+        # Bumped after every write; keys the decoded-row cache below
+        self._version = 0
+        self._row_cache = (-1, None, {})  # (version, node name, {neighbor name: score})
+        self.merge_fraction = merge_fraction
+        self.min_merge = min_merge
+        self._merge_at = min_merge  # delta size that triggers the next merge
+
+    # --- interning ---
+
+    def _intern(self, name: str) -> int:
+        node_id = self._ids.get(name)
+        if node_id is None:
+            node_id = len(self._names)
+            self._ids[name] = node_id
+            self._names.append(name)
+        return node_id
+
+    def node_id(self, name: str):
+        return self._ids.get(name)
+
+    def node_name(self, node_id: int) -> str:
+        return self._names[node_id]
+
+    # --- mutation ---
+
+    def add_node(self, name: str):
+        self._intern(name)
+
+    def add_edge(self, u: str, v: str, score: float = 0.0):
+        # Hot path of graph building: plain dict operations only. Both
+        # directions are always written together, so one check counts both.
+        a, b = self._ids.get(u), self._ids.get(v)
+        if a is None:
+            a = self._intern(u)
+        if b is None:
+            b = self._intern(v)
+        delta = self._state[3]
+        row_a, row_b = delta.get(a), delta.get(b)
+        if row_a is None:
+            row_a = delta[a] = {}
+        if row_b is None:
+            row_b = delta[b] = {}
+        if b not in row_a:
+            self._delta_size += 2
+        row_a[b] = score
+        row_b[a] = score
+        self._version += 1
+        if self._delta_size >= self._merge_at:
+            self.merge()
+
+    def remove_edge(self, u: str, v: str):
+        if not self.has_edge(u, v):
+            raise nx.NetworkXError(f"The edge {u}-{v} is not in the graph.")
+        a, b = self._ids[u], self._ids[v]
+        delta = self._state[3]
+        for x, y in ((a, b), (b, a)):
+            row = delta.setdefault(x, {})
+            if y not in row:
+                self._delta_size += 1
+            row[y] = None
+        self._version += 1
+        self._maybe_merge()
+
+    def _maybe_merge(self):
+        if self._delta_size >= self._merge_at:
+            self.merge()
+
+    def merge(self):
+        """Folds the delta buffer into the CSR arrays and publishes the result
+        in one assignment. Call with writers excluded."""
+        if not self._state[3]:
+            return
+        self._state = (*self._merged(self._state), {})
+        self._delta_size = 0
+        self._version += 1
+        # Merges cost O(E), so the threshold grows with the graph to keep
+        # their total cost amortised over the edges added
+        self._merge_at = max(self.min_merge, self.merge_fraction * len(self._state[1]))
+
+    def _merged(self, state):
+        """CSR arrays for `state` with its delta folded in. Delta entries win
+        over existing base entries for the same (row, col); tombstones drop
+        them. Nothing is modified, so readers may call this without a lock."""
+        indptr, indices, scores, delta = state
+        if not delta:
+            return indptr, indices, scores
+
+        # list() and dict() copy in one step each, so a concurrent writer
+        # cannot change them mid-iteration
+        rows = list(delta)
+        cols = [dict(delta[row]) for row in rows]
+        # Read after the copy: every node id in it is interned by now
+        n = len(self._names)
+        lengths = [len(c) for c in cols]
+        d_rows = np.repeat(np.asarray(rows, dtype=np.int64), lengths)
+        d_cols = np.fromiter(chain.from_iterable(cols), dtype=np.int64, count=sum(lengths))
+        # Tombstones (None) become NaN
+        d_scores = np.array(list(chain.from_iterable(c.values() for c in cols)), dtype=np.float64)
+        base_rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        base_keys = base_rows * n + indices
+        d_keys = d_rows * n + d_cols
+        live = ~np.isnan(d_scores)
+        live_scores = d_scores[live].astype(np.float32)
+
+        # base_keys is already sorted (rows in order, each row sorted by
+        # column), so only the delta needs sorting and the merge stays linear
+        # in the size of the graph
+        keep = np.ones(len(base_keys), dtype=bool)
+        at = np.searchsorted(base_keys, d_keys)
+        hit = at < len(base_keys)
+        hit[hit] = base_keys[at[hit]] == d_keys[hit]
+        keep[at[hit]] = False
+        new_keys = d_keys[live]
+        order = np.argsort(new_keys)
+        new_keys, live_scores = new_keys[order], live_scores[order]
+        base_keys, scores = base_keys[keep], scores[keep]
+        at = np.searchsorted(base_keys, new_keys)
+        keys = np.insert(base_keys, at, new_keys)
+        merged_scores = np.insert(scores, at, live_scores)
+
+        merged_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n, minlength=n), out=merged_indptr[1:])
+        return merged_indptr, (keys % n).astype(np.int32), merged_scores
+
+    # --- queries ---
+
+    @staticmethod
+    def _row(state, node_id: int):
+        indptr, indices, scores, _ = state
+        if node_id + 1 < len(indptr):
+            lo, hi = indptr[node_id], indptr[node_id + 1]
+            return indices[lo:hi], scores[lo:hi]
+        return indices[:0], scores[:0]
+
+    def neighbor_ids(self, node_id: int):
+        """(neighbor ids, scores) arrays for an interned node id."""
+        state = self._state
+        cols, scores = self._row(state, node_id)
+        delta = state[3].get(node_id)
+        if not delta:
+            return cols, scores
+        merged = dict(zip(cols.tolist(), scores.tolist()))
+        merged.update(delta)
+        merged = {col: score for col, score in merged.items() if score is not None}
+        return (np.fromiter(merged.keys(), dtype=np.int32, count=len(merged)),
+                np.fromiter(merged.values(), dtype=np.float32, count=len(merged)))
+
+    def _named_row(self, name: str):
+        """{neighbor name: score} for a node, or None if it is not in the
+        graph. The most recent row is cached until the next write, so a
+        `neighbors` loop that calls `get_edge_data` per neighbor decodes
+        the row once and then does one dict lookup per edge."""
+        version = self._version
+        cached_version, cached_name, row = self._row_cache
+        if cached_version == version and cached_name == name:
+            return row
+        node_id = self._ids.get(name)
+        if node_id is None:
+            return None
+        cols, scores = self.neighbor_ids(node_id)
+        names = self._names
+        row = dict(zip([names[c] for c in cols.tolist()], scores.tolist()))
+        self._row_cache = (version, name, row)
+        return row
+
+    def neighbors(self, name: str):
+        row = self._named_row(name)
+        if row is None:
+            raise nx.NetworkXError(f"The node {name} is not in the graph.")
+        return iter(row)
+
+    def get_edge_data(self, u: str, v: str, default=None):
+        version, name, row = self._row_cache
+        if version != self._version or name != u:
+            row = self._named_row(u)
+            if row is None:
+                return default
+        score = row.get(v)
+        return default if score is None else {"score": score}
+
+    def has_edge(self, u: str, v: str) -> bool:
+        return self.get_edge_data(u, v) is not None
+
+    def degree(self, name: str) -> int:
+        return len(self.neighbor_ids(self._ids[name])[0])
+
+    def degrees(self) -> np.ndarray:
+        """Degree of every node, indexed by node id."""
+        indptr, _, _ = self._merged(self._state)
+        degrees = np.zeros(len(self._names), dtype=np.int64)
+        counts = np.diff(indptr)
+        degrees[:len(counts)] = counts
+        return degrees
+
+    def __contains__(self, name) -> bool:
+        return name in self._ids
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def nodes(self) -> list[str]:
+        return self._names
+
+    def number_of_nodes(self) -> int:
+        return len(self._names)
+
+    def number_of_edges(self) -> int:
+        return len(self._merged(self._state)[1]) // 2
+
+    def edges(self, data: bool = False):
+        state = (*self._merged(self._state), {})
+        names = self._names
+        for u in range(len(state[0]) - 1):
+            cols, scores = self._row(state, u)
+            for v, score in zip(cols.tolist(), scores.tolist()):
+                if v > u:
+                    yield (names[u], names[v], {"score": score}) if data else (names[u], names[v])
+
+    def csr(self):
+        """(indptr, indices, scores) with the delta folded in. Later merges
+        replace these arrays instead of writing into them, so the caller
+        can keep reading them without holding a lock. Nodes added since
+        the last merge and without edges may lie past the end of indptr."""
+        self.merge()
+        return self._state[:3]
+
+    def nbytes(self) -> int:
+        """Bytes held by the CSR arrays (excludes the name table)."""
+        indptr, indices, scores, _ = self._state
+        return indptr.nbytes + indices.nbytes + scores.nbytes
+
+    # --- conversion ---
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph) -> "CompactGraph":
+        compact = cls()
+        for node in graph.nodes:
+            compact.add_node(node)
+        for u, v, data in graph.edges(data=True):
+            compact.add_edge(u, v, score=data.get("score", 0.0))
+        compact.merge()
+        return compact
+
+    @classmethod
+    def from_arrays(cls, names: list[str], us, vs, scores) -> "CompactGraph":
+        """Builds a graph in one pass from parallel arrays of endpoint ids
+        (indices into `names`) and scores. Duplicate edges keep the last score."""
+        compact = cls()
+        for name in names:
+            compact._intern(name)
+        n = len(compact._names)
+        us, vs = np.asarray(us, dtype=np.int64), np.asarray(vs, dtype=np.int64)
+        keep = us != vs
+        us, vs = us[keep], vs[keep]
+        scores = np.asarray(scores, dtype=np.float32)[keep]
+
+        # Both directions of each edge, interleaved to preserve input order
+        keys = np.stack([us * n + vs, vs * n + us], axis=1).ravel()
+        scores = np.repeat(scores, 2)
+        # np.unique keeps the first occurrence; reverse so the last one wins
+        keys, first = np.unique(keys[::-1], return_index=True)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n, minlength=n), out=indptr[1:])
+        compact._state = (indptr, (keys % n).astype(np.int32), scores[::-1][first], {})
+        return compact
+
+    def to_networkx(self) -> nx.Graph:
+        graph = nx.Graph()
+        graph.add_nodes_from(self._names)
+        graph.add_edges_from(self.edges(data=True))
+        return graph
@@ -0,0 +1,126 @@
+import os
+
+# Embedding model / service
+CLIP_MODEL_NAME = os.environ.get("CLIP_MODEL_NAME", "openai/clip-vit-base-patch16")
+EMBED_DIM = int(os.environ.get("EMBED_DIM", "512"))
+# Pre-converted local copy of the model (`python clip_engine.py --save`);
+# its safetensors weights are memory-mapped instead of fetched/unpickled.
+CLIP_MODEL_DIR = os.environ.get("CLIP_MODEL_DIR", "models/clip")
+# Run one small text + image batch after loading so the first request does
+# not pay for lazy kernel initialization.
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") == "1"
+
+# Inference backend for the CLIP towers: "torch" (eager fp32) or "onnx"
+# (ONNX Runtime on models exported to ONNX_DIR, optionally dynamic int8).
+# ORT thread counts of 0 leave the choice to ONNX Runtime.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+ONNX_DIR = os.environ.get("ONNX_DIR", "models/onnx")
+ONNX_INT8 = os.environ.get("ONNX_INT8", "0") == "1"
+ORT_INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+
+# "remote" talks to app.py over HTTP, "local" loads CLIP inside this process.
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "remote")
+EMBED_URL = os.environ.get("EMBED_URL", "http://localhost:8009")
+EMBED_POOL_SIZE = int(os.environ.get("EMBED_POOL_SIZE", "16"))
+EMBED_TIMEOUT = float(os.environ.get("EMBED_TIMEOUT", "30"))
+
+# Micro-batching knobs for app.py: how many concurrent /embed calls may be
+# pooled into one forward pass, and how long the first one waits for company.
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.environ.get("EMBED_MAX_WAIT_MS", "5"))
+
+# Image decode/resize/normalize runs in a process pool of this many workers
+# (0 = inline); preprocessed images wait in a queue of at most
+# PREPROCESS_QUEUE items in front of the batched model runner.
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PREPROCESS_QUEUE = int(os.environ.get("PREPROCESS_QUEUE", "256"))
+
+# Query embedding cache: in-process LRU size and Redis tier TTL (seconds)
+EMB_CACHE_MAX_BYTES = int(os.environ.get("EMB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EMB_CACHE_TTL = int(os.environ.get("EMB_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Search result cache TTL (seconds); entries are also invalidated on ingest
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "3600"))
+
+# Graph expansion: BFS levels, max neighbors taken per node, per-hop decay
+GRAPH_EXPANSION_DEPTH = int(os.environ.get("GRAPH_EXPANSION_DEPTH", "1"))
+GRAPH_FAN_OUT = int(os.environ.get("GRAPH_FAN_OUT", "10"))
+GRAPH_DECAY = float(os.environ.get("GRAPH_DECAY", "0.9"))
+
+# Graph-centrality priors (graph_rank.py): PageRank over the semantic graph,
+# plus one personalized run per modality, recomputed every
+# RANK_REFRESH_SECONDS. Search ranks by (1 - RANK_WEIGHT) * similarity +
+# RANK_WEIGHT * prior. 0 (the default) keeps pure similarity ranking and
+# does not start the refresh thread.
+RANK_WEIGHT = float(os.environ.get("RANK_WEIGHT", "0"))
+RANK_REFRESH_SECONDS = float(os.environ.get("RANK_REFRESH_SECONDS", "300"))
+RANK_DAMPING = float(os.environ.get("RANK_DAMPING", "0.85"))
+RANK_ITERATIONS = int(os.environ.get("RANK_ITERATIONS", "50"))
+RANK_TOL = float(os.environ.get("RANK_TOL", "1e-6"))
+RANK_PERSONALIZE = os.environ.get("RANK_PERSONALIZE", "1") == "1"
+
+# Vector index. INDEX_ALIAS is what queries use; it points at a physical
+# index (idx:docs:v<N>) so the index can be rebuilt and swapped online.
+INDEX_ALIAS = os.environ.get("INDEX_ALIAS", "docs")
+LEGACY_INDEX_NAME = "idx:docs"
+INDEX_ALGORITHM = os.environ.get("INDEX_ALGORITHM", "FLAT").upper()
+HNSW_M = int(os.environ.get("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_RUNTIME = int(os.environ.get("HNSW_EF_RUNTIME", "10"))
+# The live index's algorithm is read from FT.INFO and re-checked at most
+# this often (seconds), so an online migration is picked up
+INDEX_INFO_TTL = float(os.environ.get("INDEX_INFO_TTL", "30"))
+
+# Semantic graph persistence: snapshot + append-only edge log replayed on
+# startup. The log is fsynced at most every GRAPH_FSYNC_INTERVAL_MS and
+# folded into a new snapshot after GRAPH_COMPACT_EVERY records.
+GRAPH_FILE = os.environ.get("GRAPH_FILE", "semantic_graph.pkl")
+GRAPH_LOG_FILE = os.environ.get("GRAPH_LOG_FILE", "semantic_graph.log")
+GRAPH_FSYNC_INTERVAL_MS = float(os.environ.get("GRAPH_FSYNC_INTERVAL_MS", "50"))
+GRAPH_COMPACT_EVERY = int(os.environ.get("GRAPH_COMPACT_EVERY", "100000"))
+# "compact" keeps the graph in CSR arrays (compact_graph.py), "networkx" in a nx.Graph
+GRAPH_BACKEND = os.environ.get("GRAPH_BACKEND", "compact")
+# Max edges per node; inserting beyond it evicts the node's weakest edge
+# (0 = unbounded)
+GRAPH_MAX_DEGREE = int(os.environ.get("GRAPH_MAX_DEGREE", "32"))
+
+# Near-duplicate gate at ingest (dedup.py): "off", "reject" (refuse the
+# item) or "alias" (map its hash to the existing doc). Items whose cosine to
+# a stored doc is at least DEDUP_THRESHOLD count as duplicates. Candidates
+# come from DEDUP_BANDS LSH buckets over a DEDUP_BITS SimHash signature,
+# each holding its DEDUP_BUCKET_CAP most recent keys, in "redis" or "memory".
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "off")
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.97"))
+DEDUP_BITS = int(os.environ.get("DEDUP_BITS", "64"))
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", "8"))
+DEDUP_BUCKET_CAP = int(os.environ.get("DEDUP_BUCKET_CAP", "16"))
+DEDUP_STORE = os.environ.get("DEDUP_STORE", "redis")
+
+# Redis connection; request handlers share a bounded async connection pool
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", "5"))
+
+# Graph export: nodes fetched from Redis per pipeline
+GRAPH_EXPORT_CHUNK = int(os.environ.get("GRAPH_EXPORT_CHUNK", "500"))
+
+# Vector storage in the Redis index: float32, float16 or int8 (scalar
+# quantized with a per-vector scale). Compressed modes over-fetch
+# RERANK_FACTOR x k candidates and re-rank them exactly from the
+# full-precision copy in the local vector shard at SHARD_PATH.
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE", "float32").lower()
+RERANK_FACTOR = int(os.environ.get("RERANK_FACTOR", "4"))
+SHARD_PATH = os.environ.get("SHARD_PATH", "vectors/docs")
+
+# KNN backend: "redis" queries the RediSearch index, "shard" does an exact
+# in-process search over the memory-mapped vector shard at SHARD_PATH.
+KNN_BACKEND = os.environ.get("KNN_BACKEND", "redis")
+SHARD_SEQ_KEY = "shard:seq"
+
+# Uploads are read (and hashed) in chunks of this many bytes
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Log level for the services and CLIs (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
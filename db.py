@@ -1,42 +1,349 @@
 import redis
+import redis.asyncio as aioredis
+import time
+import argparse
+import logging
 import numpy as np
 from redisgraph import Graph
 from typing import List, Dict, Any
 from redis.commands.search.field import TextField, NumericField, TagField, VectorField
 from redis.commands.search.index_definition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
+import config
+import metrics
+import quantize
 
-def storeVec(key: str, vector: list, data: str, r: redis.Redis, mtype: str):
-    vecBytes = VectoBytes(vector)
-    i = r.hset(key, mapping={
-        "embedding": vecBytes,
+log = logging.getLogger(__name__)
+
+
+class CountingPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        if self.command_stack:
+            metrics.redis_round_trip()
+        return await super().execute(raise_on_error)
+
+
+class CountingRedis(aioredis.Redis):
+    """Async client that reports Redis round trips to metrics: one per
+    command, one per pipeline execute."""
+
+    async def execute_command(self, *args, **options):
+        metrics.redis_round_trip()
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> CountingPipeline:
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Vector fields being backfilled by a storage migration (field -> storage);
+# services write them next to the live field until the alias is swapped
+PENDING_FIELDS_KEY = "idx:docs:pending"
+
+
+def vector_layout(info: dict) -> dict:
+    """Algorithm, storage format and hash field of the vector attribute in an
+    FT.INFO reply."""
+    for attribute in info.get("attributes", []):
+        tokens = [t.decode() if isinstance(t, bytes) else str(t) for t in attribute]
+        if "VECTOR" not in tokens:
+            continue
+        upper = [t.upper() for t in tokens]
+
+        def value(name):
+            return tokens[upper.index(name) + 1] if name in upper[:-1] else None
+
+        algorithm = (value("ALGORITHM") or "").upper()
+        if not algorithm:
+            # Older RediSearch versions list HNSW-only parameters instead
+            algorithm = "HNSW" if "EF_CONSTRUCTION" in upper or "HNSW" in upper else "FLAT"
+        storages = {index_type: storage for storage, index_type in quantize.INDEX_TYPES.items()}
+        data_type = (value("DATA_TYPE") or "").upper()
+        return {"algorithm": algorithm, "storage": storages.get(data_type, config.VECTOR_STORAGE),
+                "field": value("IDENTIFIER") or "embedding"}
+    return default_layout()
+
+
+def default_layout() -> dict:
+    """Layout assumed when there is no index to ask (fresh install, fakeredis)."""
+    return {"algorithm": config.INDEX_ALGORITHM, "storage": config.VECTOR_STORAGE, "field": "embedding"}
+
+
+def index_layout(r: redis.Redis) -> dict:
+    """vector_layout of the index INDEX_ALIAS points at (sync client)."""
+    try:
+        return vector_layout(r.ft(config.INDEX_ALIAS).info())
+    except redis.ResponseError:
+        return default_layout()
+
+
+_layout = {"value": None, "checked": float("-inf")}
+
+
+async def live_layout(r: aioredis.Redis, refresh: bool = False) -> dict:
+    """Vector layout of the live index plus the fields a running storage
+    migration is backfilling ("pending": [(field, storage)]). Services read,
+    write and query vectors through this rather than VECTOR_STORAGE, so
+    they follow `python db.py --storage ...` without a restart. Cached for
+    INDEX_INFO_TTL seconds."""
+    now = time.monotonic()
+    if refresh or now - _layout["checked"] >= config.INDEX_INFO_TTL:
+        try:
+            layout = vector_layout(await r.ft(config.INDEX_ALIAS).info())
+        except redis.ResponseError:
+            layout = default_layout()
+        pending = await r.hgetall(PENDING_FIELDS_KEY)
+        layout["pending"] = [(f.decode(), s.decode()) for f, s in pending.items() if f.decode() != layout["field"]]
+        _layout["value"], _layout["checked"] = layout, now
+    return _layout["value"]
+
+
+def vector_fields(vector, layout: dict) -> dict:
+    """Hash fields for `vector` under the live layout and any pending one."""
+    fields = quantize.encode(vector, layout["storage"], layout["field"])
+    for field, storage in layout.get("pending", ()):
+        fields.update(quantize.encode(vector, storage, field))
+    return fields
+
+
+async def storeVec(key: str, vector: list, data: str, r: aioredis.Redis, mtype: str, shard=None):
+    fields = vector_fields(vector, await live_layout(r))
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(key, mapping={
+        **fields,
         "data": data,
         "type": mtype
     })
-    if i == 3:
-        print(f"Stored {mtype} vector for key: {key}")
+    pipe.incr(config.SHARD_SEQ_KEY)
+    i, seq = await pipe.execute()
+    if shard is not None:
+        shard.append(key, vector, mtype, seq)
+    if i == len(fields) + 2:
+        log.debug("Stored %s vector for key: %s", mtype, key)
     else:
-        print(f"Stored {i} fields for key: {key} (expected 3)")
+        log.warning("Stored %d fields for key: %s (expected %d)", i, key, len(fields) + 2)
+
+async def storeVecBatch(items: list[tuple], r: aioredis.Redis, shard=None):
+    """Writes (key, vector, data, mtype) tuples in one pipeline."""
+    layout = await live_layout(r)
+    pipe = r.pipeline(transaction=False)
+    for key, vector, data, mtype in items:
+        pipe.hset(key, mapping={
+            **vector_fields(vector, layout),
+            "data": data,
+            "type": mtype
+        })
+    pipe.incrby(config.SHARD_SEQ_KEY, len(items))
+    last_seq = (await pipe.execute())[-1]
+    if shard is not None:
+        first_seq = last_seq - len(items) + 1
+        shard.append_many([item[0] for item in items], [item[1] for item in items],
+                          [item[3] for item in items], list(range(first_seq, last_seq + 1)))
+    log.debug("Stored %d vectors in one pipeline", len(items))
+
+async def loadVec(key: str, r: aioredis.Redis, shard=None):
+    """Float32 vector for a stored key, or None if the key does not exist.
+    Prefers the exact copy in the shard over decoding a compressed field."""
+    if shard is not None:
+        v = shard.get(key)
+        if v is not None:
+            return v
+    layout = await live_layout(r)
+    blob, scale = await r.hmget(key, layout["field"], quantize.scale_field(layout["field"]))
+    if not blob:
+        return None
+    return quantize.decode(blob, scale, layout["storage"])
+
+async def existsMany(keys: list[str], r: aioredis.Redis) -> list[bool]:
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.exists(key)
+    return [bool(n) for n in await pipe.execute()]
+
+def syncShard(r: redis.Redis, shard, batch: int = 500):
+    """Brings the local vector shard up to date with Redis at startup. The
+    shard records the highest ingest sequence number it has seen; if Redis is
+    ahead (or the doc counts differ) the missing docs are copied over."""
+    redis_seq = int(r.get(config.SHARD_SEQ_KEY) or 0)
+    doc_count = int(r.ft(config.INDEX_ALIAS).info().get("num_docs", 0))
+    if shard.seq >= redis_seq and len(shard) >= doc_count:
+        log.info("Vector shard up to date (%d vectors, seq %d).", len(shard), shard.seq)
+        return
+
+    layout = index_layout(r)
+    field = layout["field"]
+    missing = [k for k in (k.decode() for k in r.scan_iter(match="doc:*", count=1000)) if k not in shard]
+    for start in range(0, len(missing), batch):
+        chunk = missing[start:start + batch]
+        pipe = r.pipeline(transaction=False)
+        for key in chunk:
+            pipe.hmget(key, field, quantize.scale_field(field), "type")
+        for key, (blob, scale, mtype) in zip(chunk, pipe.execute()):
+            if blob:
+                shard.append(key, quantize.decode(blob, scale, layout["storage"]),
+                             mtype.decode() if mtype else "", redis_seq)
+    log.info("Vector shard caught up: %d vectors added, now %d (seq %d).", len(missing), len(shard), redis_seq)
 
 def VectoBytes(vector: list[float]) -> bytes:
     return np.array(vector, dtype=np.float32).tobytes()
 
+def copyVectors(r: redis.Redis, source: dict, field: str, storage: str, batch: int = 500):
+    """Writes every doc:* vector from the `source` layout's field into
+    `field` in `storage` format, leaving the source field in place. Only
+    Redis is touched; services keep their own shards."""
+    keys = [k.decode() for k in r.scan_iter(match="doc:*", count=1000)]
+    src_field = source["field"]
+    for start in range(0, len(keys), batch):
+        chunk = keys[start:start + batch]
+        pipe = r.pipeline(transaction=False)
+        for key in chunk:
+            pipe.hmget(key, src_field, quantize.scale_field(src_field))
+        rows = pipe.execute()
+        pipe = r.pipeline(transaction=False)
+        for key, (blob, scale) in zip(chunk, rows):
+            if blob:
+                pipe.hset(key, mapping=quantize.encode(quantize.decode(blob, scale, source["storage"]),
+                                                       storage, field))
+        pipe.execute()
+        log.info("Copied %d/%d vectors to %s as %s", min(start + batch, len(keys)), len(keys), field, storage)
 
 
-def create_index(r: redis.Redis, dim: int):
+def dropVectorField(r: redis.Redis, field: str, batch: int = 500):
+    """Deletes a retired vector field (and its scale) from every doc:*."""
+    keys = [k.decode() for k in r.scan_iter(match="doc:*", count=1000)]
+    for start in range(0, len(keys), batch):
+        pipe = r.pipeline(transaction=False)
+        for key in keys[start:start + batch]:
+            pipe.hdel(key, field, quantize.scale_field(field))
+        pipe.execute()
+    log.info("Deleted field %s from %d docs", field, len(keys))
+
+
+def index_schema(dim: int, algorithm: str = config.INDEX_ALGORITHM, m: int = config.HNSW_M,
+                 ef_construction: int = config.HNSW_EF_CONSTRUCTION,
+                 ef_runtime: int = config.HNSW_EF_RUNTIME, storage: str = config.VECTOR_STORAGE,
+                 field: str = "embedding") -> list:
+    attributes = {
+        "TYPE": quantize.index_type(storage),
+        "DIM": dim,
+        "DISTANCE_METRIC": "COSINE"
+    }
+    if algorithm == "HNSW":
+        attributes.update({"M": m, "EF_CONSTRUCTION": ef_construction, "EF_RUNTIME": ef_runtime})
+    elif algorithm != "FLAT":
+        raise ValueError(f"Unsupported index algorithm: {algorithm}")
+    return [
+        TextField("id"),
+        TextField("data"),
+        TagField("type"),
+        # Queries always say @embedding, whichever hash field holds the vectors
+        VectorField(field, algorithm, attributes, as_name="embedding")
+    ]
+
+
+def index_exists(r: redis.Redis, name: str) -> bool:
     try:
-        r.ft("idx:docs").info()
-        print("Index already exists.")
-    except:
-        schema = [
-            TextField("id"),
-            TextField("data"),
-            TextField("type"),
-            VectorField("embedding", "FLAT", {
-                "TYPE": "FLOAT32",
-                "DIM": dim,
-                "DISTANCE_METRIC": "COSINE"
-            })
-        ]
-        r.ft("idx:docs").create_index(schema)
-        print(f"Index created with dimension {dim} and COSINE metric.")
\ No newline at end of file
+        r.ft(name).info()
+        return True
+    except redis.ResponseError:
+        return False
+
+
+def _build_index(r: redis.Redis, dim: int, algorithm: str, prefix: str = "doc:", **params) -> str:
+    name = f"{config.LEGACY_INDEX_NAME}:v{r.incr('idx:docs:version')}"
+    definition = IndexDefinition(prefix=[prefix], index_type=IndexType.HASH)
+    r.ft(name).create_index(index_schema(dim, algorithm, **params), definition=definition)
+    return name
+
+
+def create_index(r: redis.Redis, dim: int):
+    if index_exists(r, config.INDEX_ALIAS):
+        log.info("Index already exists.")
+        return
+
+    name = _build_index(r, dim, config.INDEX_ALGORITHM)
+    if index_exists(r, config.LEGACY_INDEX_NAME):
+        # The pre-alias idx:docs indexed `type` as TEXT, which the filtered
+        # KNN queries cannot use; reindex the same documents into a new one.
+        log.info("Reindexing documents from %s into %s; the old index can be dropped once this finishes.",
+                 config.LEGACY_INDEX_NAME, name)
+        wait_for_indexing(r, name)
+    r.ft(name).aliasadd(config.INDEX_ALIAS)
+    log.info("Index %s (%s) created with dimension %d and COSINE metric.", name, config.INDEX_ALGORITHM, dim)
+
+
+def wait_for_indexing(r: redis.Redis, name: str, poll: float = 1.0):
+    while True:
+        info = r.ft(name).info()
+        if int(info.get("indexing", 0)) == 0 and float(info.get("percent_indexed", 1)) >= 1:
+            return
+        log.info("Indexing %s: %.1f%%", name, float(info.get('percent_indexed', 0)) * 100)
+        time.sleep(poll)
+
+
+def migrate_index(r: redis.Redis, dim: int, algorithm: str = None, storage: str = None,
+                  drop_old: bool = False, **params) -> str:
+    """Builds a new index next to the live one, waits for the background scan
+    to finish, then swaps INDEX_ALIAS over with FT.ALIASUPDATE. Queries keep
+    hitting the old index until the swap, so there is no downtime.
+
+    `algorithm` and `storage` default to the live index's. A new storage
+    format goes into a new hash field, so the live index is never touched:
+    the field is announced under PENDING_FIELDS_KEY, so running services
+    start writing it as well. Then existing docs are copied and the new
+    index is built on it. After the swap, once services have re-read the
+    layout, the old field is deleted."""
+    live = index_layout(r)
+    old_name = r.ft(config.INDEX_ALIAS).info()["index_name"]
+    if isinstance(old_name, bytes):
+        old_name = old_name.decode()
+    algorithm = algorithm or live["algorithm"]
+    storage = storage or live["storage"]
+    settle = config.INDEX_INFO_TTL + 1
+
+    field = live["field"]
+    if storage != live["storage"]:
+        field = "embedding" if live["field"] != "embedding" else f"embedding_{storage}"
+        r.hset(PENDING_FIELDS_KEY, field, storage)
+        log.info("Waiting %.0fs for services to start writing %s...", settle, field)
+        time.sleep(settle)
+        copyVectors(r, live, field, storage)
+
+    new_name = _build_index(r, dim, algorithm, storage=storage, field=field, **params)
+    log.info("Building %s (%s, %s) alongside %s...", new_name, algorithm, storage, old_name)
+    wait_for_indexing(r, new_name)
+
+    r.ft(new_name).aliasupdate(config.INDEX_ALIAS)
+    log.info("Alias %s now points at %s.", config.INDEX_ALIAS, new_name)
+
+    if field != live["field"]:
+        r.hdel(PENDING_FIELDS_KEY, field)
+        log.info("Waiting %.0fs for services to switch to %s...", settle, field)
+        time.sleep(settle)
+        dropVectorField(r, live["field"])
+
+    if drop_old:
+        r.ft(old_name).dropindex(delete_documents=False)
+        log.info("Dropped %s (documents kept).", old_name)
+    return new_name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the vector index online and swap the alias.")
+    parser.add_argument("--algorithm", choices=["FLAT", "HNSW"], default=None,
+                        help="default: the live index's algorithm")
+    parser.add_argument("--m", type=int, default=config.HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=config.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef-runtime", type=int, default=config.HNSW_EF_RUNTIME)
+    parser.add_argument("--dim", type=int, default=config.EMBED_DIM)
+    parser.add_argument("--storage", choices=list(quantize.INDEX_TYPES), default=None,
+                        help="store and index vectors in this format (default: the live index's)")
+    parser.add_argument("--drop-old", action="store_true")
+    args = parser.parse_args()
+    metrics.setup_logging()
+
+    r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT)
+    algorithm = args.algorithm or index_layout(r)["algorithm"]
+    params = {}
+    if algorithm == "HNSW":
+        params.update({"m": args.m, "ef_construction": args.ef_construction, "ef_runtime": args.ef_runtime})
+    migrate_index(r, args.dim, algorithm, args.storage, drop_old=args.drop_old, **params)
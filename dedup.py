@@ -0,0 +1,162 @@
+import threading
+from collections import deque
+from typing import Optional
+import numpy as np
+import redis.asyncio as aioredis
+import config
+import db
+import metrics
+import quantize
+
+
+class NearDuplicateIndex:
+    """Near-duplicate gate for ingest, using random-hyperplane LSH.
+
+    Each embedding gets a `bits`-bit SimHash signature: the signs of its
+    projections onto fixed random hyperplanes. Two vectors at angle theta
+    agree on each bit with probability 1 - theta / pi. The signature is cut
+    into `bands` bands, and every band value names a bucket. A near copy
+    very likely shares at least one bucket, while an unrelated vector almost
+    never does. Buckets are Redis lists (`lsh:<band>:<value>`) or, with
+    store="memory", in-process deques. Each keeps its `bucket_cap` most
+    recent keys.
+
+    A lookup reads at most bands * bucket_cap candidates and checks their
+    exact cosine, so an insert costs the same at any corpus size. The
+    hyperplanes come from a fixed seed, so signatures stay valid across
+    restarts and workers.
+    """
+
+    def __init__(self, r: Optional[aioredis.Redis], dim: int = config.EMBED_DIM,
+                 threshold: float = config.DEDUP_THRESHOLD, bits: int = config.DEDUP_BITS,
+                 bands: int = config.DEDUP_BANDS, bucket_cap: int = config.DEDUP_BUCKET_CAP,
+                 store: str = config.DEDUP_STORE, prefix: str = "lsh:", seed: int = 0):
+        if bits % bands:
+            raise ValueError(f"DEDUP_BITS ({bits}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.r = r
+        self.threshold = threshold
+        self.bands = bands
+        self.bucket_cap = bucket_cap
+        self.store = store
+        self.prefix = prefix
+        self.planes = np.random.default_rng(seed).standard_normal((bits, dim)).astype(np.float32)
+        self._weights = (1 << np.arange(bits // bands, dtype=np.uint64))
+        self._buckets: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def bucket_keys(self, vectors) -> list[list[str]]:
+        """Bucket names (one per band) for each row of `vectors`."""
+        signs = (np.atleast_2d(np.asarray(vectors, dtype=np.float32)) @ self.planes.T) > 0
+        values = signs.reshape(len(signs), self.bands, -1).astype(np.uint64) @ self._weights
+        return [[f"{self.prefix}{band}:{int(value):x}" for band, value in enumerate(row)] for row in values]
+
+    async def _members(self, buckets: list[list[str]]) -> list[list[str]]:
+        if self.store == "memory":
+            with self._lock:
+                return [[k for b in row for k in self._buckets.get(b, ())] for row in buckets]
+        pipe = self.r.pipeline(transaction=False)
+        for row in buckets:
+            for bucket in row:
+                pipe.lrange(bucket, 0, self.bucket_cap - 1)
+        replies = iter(await pipe.execute())
+        return [[k.decode() for _ in row for k in next(replies)] for row in buckets]
+
+    async def _vectors(self, keys: list[str], shard=None) -> dict:
+        """Float32 vectors for candidate keys, from the shard when it has them."""
+        out = {}
+        if shard is not None:
+            found_vecs, found = shard.get_many(keys)
+            out = {k: v for k, v, ok in zip(keys, found_vecs, found) if ok}
+        missing = [k for k in keys if k not in out]
+        if missing:
+            layout = await db.live_layout(self.r)
+            pipe = self.r.pipeline(transaction=False)
+            for key in missing:
+                pipe.hmget(key, layout["field"], quantize.scale_field(layout["field"]))
+            for key, (blob, scale) in zip(missing, await pipe.execute()):
+                if blob:
+                    out[key] = quantize.decode(blob, scale, layout["storage"])
+        return out
+
+    @metrics.timed("dedup")
+    async def find_many(self, vectors, shard=None) -> list[Optional[tuple]]:
+        """(existing key, cosine) of the closest stored near-duplicate for each
+        vector, or None. A vector that matches an earlier non-duplicate one in
+        the same call is also reported, with that item's position (an int) in
+        place of the key."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if not len(vectors):
+            return []
+        unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        candidates = [list(dict.fromkeys(keys)) for keys in await self._members(self.bucket_keys(unit))]
+        stored = await self._vectors(list({k for keys in candidates for k in keys}), shard)
+
+        results = []
+        kept = []
+        for i, keys in enumerate(candidates):
+            best = None
+            keys = [k for k in keys if k in stored]
+            if keys:
+                mat = np.stack([stored[k] for k in keys])
+                sims = (mat @ unit[i]) / np.maximum(np.linalg.norm(mat, axis=1), 1e-12)
+                j = int(np.argmax(sims))
+                if sims[j] >= self.threshold:
+                    best = (keys[j], float(sims[j]))
+            if best is None and kept:
+                sims = unit[kept] @ unit[i]
+                j = int(np.argmax(sims))
+                if sims[j] >= self.threshold:
+                    best = (kept[j], float(sims[j]))
+            if best is None:
+                kept.append(i)
+            results.append(best)
+        metrics.DEDUP_CHECKS.inc(len(results) - len(kept), "duplicate")
+        metrics.DEDUP_CHECKS.inc(len(kept), "unique")
+        return results
+
+    async def find(self, vector, shard=None) -> Optional[tuple]:
+        return (await self.find_many([vector], shard))[0]
+
+    def _add_local(self, keys: list[str], buckets: list[list[str]]):
+        with self._lock:
+            for key, row in zip(keys, buckets):
+                for bucket in row:
+                    members = self._buckets.get(bucket)
+                    if members is None:
+                        members = self._buckets[bucket] = deque(maxlen=self.bucket_cap)
+                    members.appendleft(key)
+
+    async def add_many(self, keys: list[str], vectors):
+        """Files stored keys under their buckets, in one pipeline."""
+        if not keys:
+            return
+        buckets = self.bucket_keys(vectors)
+        if self.store == "memory":
+            self._add_local(keys, buckets)
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for key, row in zip(keys, buckets):
+            for bucket in row:
+                pipe.lpush(bucket, key)
+                pipe.ltrim(bucket, 0, self.bucket_cap - 1)
+        await pipe.execute()
+
+    async def add(self, key: str, vector):
+        await self.add_many([key], [vector])
+
+    def backfill(self, keys: list[str], vectors, chunk: int = 10000):
+        """Fills the in-memory buckets from already stored vectors (startup)."""
+        for start in range(0, len(keys), chunk):
+            self._add_local(keys[start:start + chunk], self.bucket_keys(vectors[start:start + chunk]))
+
+    async def alias(self, targets: dict):
+        """Records `key -> existing key` for content stored as a near copy."""
+        await self.r.mset({f"alias:{key}": target for key, target in targets.items()})
+
+    async def resolve_many(self, keys: list[str]) -> dict:
+        """key -> existing key for the keys recorded by `alias`."""
+        targets = await self.r.mget([f"alias:{key}" for key in keys])
+        return {key: target.decode() for key, target in zip(keys, targets) if target}
+
+    async def resolve(self, key: str) -> Optional[str]:
+        return (await self.resolve_many([key])).get(key)
@@ -0,0 +1,135 @@
+from collections import deque
+from itertools import islice
+import numpy as np
+import config
+from compact_graph import CompactGraph
+
+
+def node_position(graph):
+    """Returns a name -> stable integer position lookup for the graph's nodes."""
+    if isinstance(graph, CompactGraph):
+        return graph.node_id
+    return {name: i for i, name in enumerate(graph.nodes)}.get
+
+
+def weighted_neighbors(graph, node: str, min_score: float = 0.0):
+    """(neighbor, score) pairs for `node` with score >= min_score."""
+    if isinstance(graph, CompactGraph):
+        ids, scores = graph.neighbor_ids(graph.node_id(node))
+        return [(graph.node_name(i), s) for i, s in zip(ids.tolist(), scores.tolist()) if s >= min_score]
+    pairs = ((nbr, data.get("score", 0)) for nbr, data in graph[node].items())
+    return [(nbr, s) for nbr, s in pairs if s >= min_score]
+
+
+def degree_stats(graph, max_degree: int = config.GRAPH_MAX_DEGREE) -> dict:
+    """Degree distribution summary: percentiles plus a histogram with
+    power-of-two buckets ("0", "1", "2-3", "4-7", ...)."""
+    if isinstance(graph, CompactGraph):
+        degrees = graph.degrees()
+    else:
+        degrees = np.fromiter((d for _, d in graph.degree()), dtype=np.int64, count=graph.number_of_nodes())
+    stats = {"nodes": int(len(degrees)), "edges": int(degrees.sum()) // 2, "max_degree_bound": max_degree}
+    if not len(degrees):
+        return {**stats, "histogram": {}}
+
+    histogram = {}
+    buckets = np.where(degrees > 0, np.floor(np.log2(np.maximum(degrees, 1))).astype(np.int64) + 1, 0)
+    for b, count in zip(*np.unique(buckets, return_counts=True)):
+        lo, hi = (0, 0) if b == 0 else (1 << (b - 1), (1 << b) - 1)
+        histogram[str(lo) if lo == hi else f"{lo}-{hi}"] = int(count)
+    return {
+        **stats,
+        "mean": round(float(degrees.mean()), 3),
+        "max": int(degrees.max()),
+        **{f"p{p}": round(float(np.percentile(degrees, p)), 3) for p in (50, 90, 99)},
+        "at_bound": int((degrees >= max_degree).sum()) if max_degree else 0,
+        "histogram": histogram,
+    }
+
+
+async def fetch_nodes(r, node_ids: list[str]) -> dict:
+    """Fetches only `data` and `type` for `node_ids` in one pipeline. Nodes
+    missing from Redis are left out."""
+    pipe = r.pipeline(transaction=False)
+    for node_id in node_ids:
+        pipe.hmget(node_id, "data", "type")
+    found = {}
+    for node_id, (data_val, type_val) in zip(node_ids, await pipe.execute()):
+        if data_val and type_val:
+            found[node_id] = {"id": node_id, "data": data_val.decode('utf-8'), "type": type_val.decode('utf-8')}
+    return found
+
+
+async def iter_graph(r, graph, cursor: int = 0, limit: int = None, min_degree: int = 0,
+                     min_score: float = 0.0, chunk: int = config.GRAPH_EXPORT_CHUNK):
+    """Yields node and edge records for the nodes at positions
+    [cursor, cursor + limit), fetching Redis data one chunk at a time.
+
+    Each edge is emitted once, on the page of its later endpoint, so paging
+    through the whole graph delivers every edge after both of its nodes. The
+    last record is {"kind": "end", "next_cursor": ...}; next_cursor is None
+    once the graph is exhausted.
+    """
+    total = graph.number_of_nodes()
+    end = total if limit is None else min(total, cursor + limit)
+    # Copy the page's names up front: ingest may add nodes between chunks.
+    # Positions are taken after the copy, so every page node has one.
+    page = iter(list(islice(graph.nodes, cursor, end)))
+    position = node_position(graph)
+
+    while True:
+        names = list(islice(page, chunk))
+        if not names:
+            break
+        if min_degree:
+            names = [n for n in names if graph.degree(n) >= min_degree]
+        found = await fetch_nodes(r, names)
+        for name in names:
+            node = found.get(name)
+            if node is None:
+                continue
+            yield {"kind": "node", **node}
+            pos = position(name)
+            for nbr, score in weighted_neighbors(graph, name, min_score):
+                # A neighbor without a position was added after the lookup
+                # was built, so it is the later endpoint and emits the edge
+                nbr_pos = position(nbr)
+                if nbr_pos is not None and nbr_pos < pos and (not min_degree or graph.degree(nbr) >= min_degree):
+                    yield {"kind": "edge", "from": name, "to": nbr, "score": score}
+
+    yield {"kind": "end", "next_cursor": end if end < total else None}
+
+
+async def ego_subgraph(r, graph, center: str, radius: int = 1, max_nodes: int = 200,
+                       min_score: float = 0.0) -> dict:
+    """BFS up to `radius` hops from `center`, strongest edges first, stopping
+    at `max_nodes`. Returns the nodes and the edges among them."""
+    if center not in graph:
+        return {"nodes": [], "edges": []}
+    selected = {center: 0}
+    frontier = deque([center])
+    while frontier and len(selected) < max_nodes:
+        node = frontier.popleft()
+        if selected[node] >= radius:
+            continue
+        for nbr, _ in sorted(weighted_neighbors(graph, node, min_score), key=lambda x: -x[1]):
+            if nbr not in selected:
+                selected[nbr] = selected[node] + 1
+                frontier.append(nbr)
+                if len(selected) >= max_nodes:
+                    break
+
+    names = list(selected)
+    found = {}
+    for i in range(0, len(names), config.GRAPH_EXPORT_CHUNK):
+        found.update(await fetch_nodes(r, names[i:i + config.GRAPH_EXPORT_CHUNK]))
+
+    nodes = [{**found[n], "hops": selected[n]} for n in names if n in found]
+    edges = []
+    for name in names:
+        if name not in found:
+            continue
+        for nbr, score in weighted_neighbors(graph, name, min_score):
+            if nbr in found and name < nbr:
+                edges.append({"from": name, "to": nbr, "score": score})
+    return {"nodes": nodes, "edges": edges}
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+import numpy as np
+import config
+import metrics
+from compact_graph import CompactGraph
+
+log = logging.getLogger(__name__)
+
+
+def pagerank(rows, cols, weights, n: int, teleport=None, damping: float = config.RANK_DAMPING,
+             iterations: int = config.RANK_ITERATIONS, tol: float = config.RANK_TOL) -> np.ndarray:
+    """Weighted PageRank by power iteration over directed edge arrays
+    (rows -> cols). Each step is one bincount over the edges, so it costs
+    O(E) and needs no sparse-matrix library. Rank that would leak from
+    nodes without edges goes back through the teleport distribution.
+    Personalized PageRank is the same computation with a non-uniform
+    `teleport`."""
+    if n == 0:
+        return np.zeros(0)
+    weights = np.maximum(np.asarray(weights, dtype=np.float64), 0.0)
+    out_weight = np.bincount(rows, weights=weights, minlength=n)
+    transition = weights / np.where(out_weight[rows] > 0, out_weight[rows], 1.0)
+    dangling = out_weight == 0
+
+    p = np.full(n, 1.0 / n) if teleport is None else teleport / teleport.sum()
+    x = p.copy()
+    for _ in range(iterations):
+        spread = np.bincount(cols, weights=x[rows] * transition, minlength=n)
+        nxt = damping * (spread + x[dangling].sum() * p) + (1 - damping) * p
+        converged = np.abs(nxt - x).sum() < tol
+        x = nxt
+        if converged:
+            break
+    return x
+
+
+def percentiles(scores: np.ndarray) -> np.ndarray:
+    """Each node's rank as a fraction in [0, 1] (1 = most central), so priors
+    are on the same scale as cosine similarity whatever the graph size.
+    Tied scores share a rank."""
+    rounded = np.round(scores * len(scores), 9)  # absorb float noise between equal ranks
+    below = np.searchsorted(np.sort(rounded), rounded, side="left")
+    return (below / max(len(scores) - 1, 1)).astype(np.float32)
+
+
+class GraphRank:
+    """Graph-centrality priors for search, recomputed in the background.
+
+    Every `interval` seconds a thread snapshots the semantic graph's edges
+    (under the store lock) and runs PageRank over them. With `node_types`,
+    it also runs one personalized PageRank per modality, teleporting only
+    to nodes of that type. The scores are kept as float32 percentile arrays
+    indexed by CompactGraph node id, or by a name index for a networkx
+    graph. `prior` is then one dict lookup and one array read, and `blend`
+    mixes a prior into a similarity score with weight `weight`. Nodes added
+    since the last refresh get the median prior, 0.5.
+    """
+
+    def __init__(self, store, node_types: Optional[Callable[[list], list]] = None,
+                 interval: float = config.RANK_REFRESH_SECONDS, weight: float = config.RANK_WEIGHT,
+                 damping: float = config.RANK_DAMPING, iterations: int = config.RANK_ITERATIONS,
+                 tol: float = config.RANK_TOL):
+        self.store = store
+        self.node_types = node_types
+        self.interval = interval
+        self.weight = weight
+        self.damping = damping
+        self.iterations = iterations
+        self.tol = tol
+        self.version = 0
+        self.refreshed_at = None
+        self._types: dict[str, str] = {}  # node -> modality, fetched once per node
+        self._snapshot = None  # (node id lookup, {"all" | modality: percentiles})
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _edges(self):
+        """(names, node id lookup, rows, cols, weights) for the current graph."""
+        with self.store.lock:
+            graph = self.store.graph
+            names = list(graph.nodes)
+            if isinstance(graph, CompactGraph):
+                indptr, cols, weights = graph.csr()
+                lookup = graph.node_id
+            else:
+                index = {name: i for i, name in enumerate(names)}
+                edges = [(index[u], index[v], data.get("score", 0.0)) for u, v, data in graph.edges(data=True)]
+                lookup = index.get
+        if isinstance(graph, CompactGraph):
+            rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        else:
+            us, vs, ws = (np.asarray(a) for a in zip(*edges)) if edges else (np.zeros(0, np.int64),) * 3
+            rows, cols, weights = np.concatenate([us, vs]), np.concatenate([vs, us]), np.concatenate([ws, ws])
+        return names, lookup, rows.astype(np.int64), np.asarray(cols, dtype=np.int64), weights
+
+    def _modalities(self, names: list[str]) -> dict:
+        missing = [name for name in names if name not in self._types]
+        if missing:
+            self._types.update(zip(missing, self.node_types(missing)))
+        types = np.array([self._types.get(name) or "" for name in names])
+        return {mtype: types == mtype for mtype in set(types.tolist()) if mtype}
+
+    @metrics.timed("graph_rank")
+    def refresh(self):
+        start = time.perf_counter()
+        names, lookup, rows, cols, weights = self._edges()
+        n = len(names)
+        scores = {"all": percentiles(pagerank(rows, cols, weights, n, damping=self.damping,
+                                              iterations=self.iterations, tol=self.tol))}
+        if self.node_types is not None and n:
+            for mtype, members in self._modalities(names).items():
+                scores[mtype] = percentiles(pagerank(rows, cols, weights, n, members.astype(np.float64),
+                                                     self.damping, self.iterations, self.tol))
+        self._snapshot = (lookup, scores)
+        self.version += 1
+        self.refreshed_at = time.time()
+        log.info("Graph rank refreshed: %d nodes, %d edges, %s in %.2fs",
+                 n, len(rows) // 2, "/".join(scores), time.perf_counter() - start)
+
+    def prior(self, node: str, query_type: str = None) -> Optional[float]:
+        """Percentile centrality of `node`, personalized to `query_type` when
+        that was computed; None before the first refresh."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        lookup, scores = snapshot
+        ranks = scores.get(query_type, scores["all"])
+        node_id = lookup(node)
+        return float(ranks[node_id]) if node_id is not None and node_id < len(ranks) else 0.5
+
+    def blend(self, similarity: float, prior: float) -> float:
+        return (1 - self.weight) * similarity + self.weight * prior
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Graph rank refresh failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="graph-rank", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        return {"version": self.version, "refreshed_at": self.refreshed_at, "weight": self.weight,
+                "interval": self.interval,
+                "modalities": sorted(self._snapshot[1]) if self._snapshot else []}
@@ -0,0 +1,228 @@
+import heapq
+import logging
+import os
+import pickle
+import threading
+import time
+from queue import Queue, Empty
+import networkx as nx
+import numpy as np
+import config
+import metrics
+from compact_graph import CompactGraph
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def convert_graph(graph, backend: str = config.GRAPH_BACKEND):
+    """Converts a loaded snapshot to the configured in-memory representation."""
+    if backend == "compact" and not isinstance(graph, CompactGraph):
+        return CompactGraph.from_networkx(graph)
+    if backend == "networkx" and isinstance(graph, CompactGraph):
+        return graph.to_networkx()
+    return graph
+
+
+def new_graph(backend: str = config.GRAPH_BACKEND):
+    return CompactGraph() if backend == "compact" else nx.Graph()
+
+
+def replay_log(graph, log_path: str) -> int:
+    """Applies the records of an edge log to `graph`. Replay is idempotent,
+    so records already folded into the snapshot are harmless. A torn last
+    line from a crash mid-write is truncated away, so the next append starts
+    on a fresh line; records that do not parse are skipped."""
+    if not os.path.exists(log_path):
+        return 0
+    count = 0
+    complete = 0  # bytes up to the end of the last full line
+    with open(log_path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            complete += len(raw)
+            parts = raw.decode("utf-8", errors="replace").rstrip("\n").split("\t")
+            try:
+                if parts[0] == "N" and len(parts) == 2:
+                    graph.add_node(parts[1])
+                elif parts[0] == "A" and len(parts) == 4:
+                    graph.add_edge(parts[1], parts[2], score=float(parts[3]))
+                elif parts[0] == "D" and len(parts) == 3:
+                    if graph.has_edge(parts[1], parts[2]):
+                        graph.remove_edge(parts[1], parts[2])
+                else:
+                    continue
+            except ValueError:
+                continue
+            count += 1
+    if complete < os.path.getsize(log_path):
+        log.warning("Truncating torn record at the end of %s", log_path)
+        with open(log_path, "ab") as f:
+            f.truncate(complete)
+    return count
+
+
+class GraphStore:
+    """Semantic graph persisted as a pickle snapshot plus an append-only log.
+
+    Mutations go through `add_node` / `add_edge`, which update the in-memory
+    graph under `lock` and queue a log record. A background thread appends
+    queued records, fsyncs once per batch, and periodically compacts the log
+    into a fresh snapshot (written to a temp file and swapped in atomically),
+    so ingest cost no longer depends on graph size.
+
+    `connect` keeps every node at no more than `max_degree` edges. Each node
+    at capacity gets a min-heap of its edges by score, built lazily, and a
+    new edge is only admitted if it beats the weakest edge of every full
+    endpoint, which is then evicted (on both sides, as the graph is
+    undirected). Heap entries for removed or re-scored edges are dropped
+    lazily when they reach the top.
+    """
+
+    def __init__(self, snapshot_path: str = config.GRAPH_FILE, log_path: str = config.GRAPH_LOG_FILE,
+                 fsync_interval_ms: float = config.GRAPH_FSYNC_INTERVAL_MS,
+                 compact_every: int = config.GRAPH_COMPACT_EVERY,
+                 max_degree: int = config.GRAPH_MAX_DEGREE):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.compact_every = compact_every
+        self.max_degree = max_degree
+        self.lock = threading.RLock()
+        self._heaps: dict[str, list] = {}
+        self.evictions = 0
+
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as f:
+                self.graph = convert_graph(pickle.load(f))
+        else:
+            self.graph = new_graph()
+        self._log_records = replay_log(self.graph, log_path)
+        log.info("Loaded graph: %d nodes, %d edges (%d log records replayed)",
+                 self.graph.number_of_nodes(), self.graph.number_of_edges(), self._log_records)
+
+        self._queue: Queue = Queue()
+        self._log = open(log_path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._run, name="graph-log", daemon=True)
+        self._writer.start()
+
+    def add_node(self, node: str):
+        with self.lock:
+            self.graph.add_node(node)
+        self._queue.put(f"N\t{node}\n")
+
+    def add_edge(self, u: str, v: str, score: float):
+        with self.lock:
+            self.graph.add_edge(u, v, score=score)
+        self._queue.put(f"A\t{u}\t{v}\t{score!r}\n")
+
+    def remove_edge(self, u: str, v: str):
+        with self.lock:
+            self.graph.remove_edge(u, v)
+        self._queue.put(f"D\t{u}\t{v}\n")
+
+    @staticmethod
+    def _heap_score(score: float) -> float:
+        # Compare at float32 precision: CompactGraph stores float32 scores
+        return float(np.float32(score))
+
+    def _heap(self, node: str) -> list:
+        heap = self._heaps.get(node)
+        if heap is None or len(heap) > 2 * self.max_degree:
+            heap = [(self._heap_score(self.graph.get_edge_data(node, nbr)["score"]), nbr)
+                    for nbr in self.graph.neighbors(node)]
+            heapq.heapify(heap)
+            self._heaps[node] = heap
+        return heap
+
+    def _weakest(self, node: str):
+        """(score, neighbor) of the node's weakest live edge."""
+        heap = self._heap(node)
+        while heap:
+            score, nbr = heap[0]
+            data = self.graph.get_edge_data(node, nbr)
+            if data is not None and self._heap_score(data["score"]) == score:
+                return score, nbr
+            heapq.heappop(heap)
+        return None
+
+    def connect(self, u: str, v: str, score: float) -> bool:
+        """Adds or re-scores the u-v edge within the degree bound, evicting the
+        weakest edge of a full endpoint. Returns False if the edge is weaker
+        than everything a full endpoint already has."""
+        if not self.max_degree:
+            self.add_edge(u, v, score)
+            return True
+        with self.lock:
+            self.graph.add_node(u)
+            self.graph.add_node(v)
+            if not self.graph.has_edge(u, v):
+                full = [x for x in (u, v) if self.graph.degree(x) >= self.max_degree]
+                if any(self._weakest(x)[0] >= self._heap_score(score) for x in full):
+                    return False
+                for x in full:
+                    while self.graph.degree(x) >= self.max_degree:
+                        _, nbr = self._weakest(x)
+                        self.remove_edge(x, nbr)
+                        self.evictions += 1
+                        metrics.GRAPH_EVICTIONS.inc()
+            self.add_edge(u, v, score)
+            for x, y in ((u, v), (v, u)):
+                if x in self._heaps:
+                    heapq.heappush(self._heaps[x], (self._heap_score(score), y))
+        return True
+
+    def _drain(self, first):
+        records = [first]
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except Empty:
+                return records
+
+    def _run(self):
+        while True:
+            records = self._drain(self._queue.get())
+            stop = _STOP in records
+            records = [rec for rec in records if rec is not _STOP]
+            if records:
+                with metrics.span("graph_fsync"):
+                    self._log.write("".join(records))
+                    self._log.flush()
+                    os.fsync(self._log.fileno())
+                metrics.BATCH_SIZE.observe(len(records), "graph_log")
+                self._log_records += len(records)
+            if self._log_records >= self.compact_every:
+                self.compact()
+            if stop:
+                return
+            # Let more records accumulate so one fsync covers a whole burst
+            time.sleep(self.fsync_interval)
+
+    @metrics.timed("graph_compact")
+    def compact(self):
+        """Writes a full snapshot and truncates the log. Only called from the
+        writer thread, so nothing is appended between snapshot and truncate."""
+        with self.lock:
+            if isinstance(self.graph, CompactGraph):
+                self.graph.merge()
+            blob = pickle.dumps(self.graph, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self._log.close()
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._log_records = 0
+        log.info("Graph snapshot written: %d nodes", self.graph.number_of_nodes())
+
+    def close(self):
+        """Flushes pending records; call on shutdown."""
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._log.close()
@@ -1,40 +1,194 @@
 from fastapi import FastAPI, Form, File, UploadFile
 from typing import Annotated, List
-from redis.commands.search.query import Query
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from pyvis.network import Network
 from fastapi.staticfiles import StaticFiles
-import networkx as nx
+from starlette.concurrency import run_in_threadpool
 import os
-import pickle
-import numpy as np
+import json
+import logging
+import time
+import anyio
 import hashlib
 import redis
+import redis.asyncio as aioredis
+import requests
 import vec
 import db
 import search
+import config
+import graph_export
+import metrics
+from cache import EmbeddingCache, ResultCache, normalize_text
+from dedup import NearDuplicateIndex
+from graph_rank import GraphRank
+from graph_store import GraphStore
+from shard import VectorShard
+from startup import Startup
+
+metrics.setup_logging()
+log = logging.getLogger(__name__)
 
 app = FastAPI()
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-r = redis.Redis(host="localhost", port=6379)
+# Request handlers share one bounded pool; callers wait for a free connection
+# instead of opening unbounded sockets under load.
+r = db.CountingRedis(connection_pool=aioredis.BlockingConnectionPool(
+    host=config.REDIS_HOST, port=config.REDIS_PORT,
+    max_connections=config.REDIS_MAX_CONNECTIONS, timeout=config.REDIS_POOL_TIMEOUT
+))
+
+embedding_cache = EmbeddingCache(r)
+result_cache = ResultCache(r)
+near_dups = NearDuplicateIndex(r) if config.DEDUP_MODE != "off" else None
+
+# Filled in by the startup phases below
+vector_shard = None
+graph_store = None
+semantic_graph = None
+graph_rank = None
 
-# Create Redis index
-db.create_index(r, 512)
 
-GRAPH_FILE = "semantic_graph.pkl"
-if os.path.exists(GRAPH_FILE):
-    with open(GRAPH_FILE, "rb") as f:
-        semantic_graph = pickle.load(f)
-else:
-    semantic_graph = nx.Graph()
+def prepare_index():
+    # Startup only, so a short-lived sync client is fine
+    db.create_index(redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT), 512)
+
+
+def load_shard():
+    # Local full-precision copy of every vector: the in-process KNN backend, and
+    # the source for exact re-ranking when the index stores float16 / int8.
+    # syncShard reads the index alias, so this runs after prepare_index.
+    global vector_shard
+    if config.KNN_BACKEND == "shard" or config.VECTOR_STORAGE != "float32":
+        shard = VectorShard(config.SHARD_PATH, 512)
+        db.syncShard(redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT), shard)
+        if near_dups is not None and config.DEDUP_STORE == "memory":
+            near_dups.backfill(shard.ids, shard.matrix())
+        vector_shard = shard
+
+
+def node_types(names: list[str]) -> list:
+    """Modality of each graph node, read from Redis in chunks (rank refresh)."""
+    client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT)
+    types = []
+    for start in range(0, len(names), config.GRAPH_EXPORT_CHUNK):
+        pipe = client.pipeline(transaction=False)
+        for name in names[start:start + config.GRAPH_EXPORT_CHUNK]:
+            pipe.hget(name, "type")
+        types.extend(t.decode() if t else None for t in pipe.execute())
+    client.close()
+    return types
+
+
+def load_graph():
+    global graph_store, semantic_graph, graph_rank
+    graph_store = GraphStore(config.GRAPH_FILE, config.GRAPH_LOG_FILE)
+    semantic_graph = graph_store.graph
+    if config.RANK_WEIGHT > 0:
+        # First refresh runs in the background; search blends nothing until it lands
+        graph_rank = GraphRank(graph_store, node_types if config.RANK_PERSONALIZE else None)
+        graph_rank.start()
 
 
-def save_graph():
-    with open(GRAPH_FILE, "wb") as f:
-        pickle.dump(semantic_graph, f)
+def load_index():
+    prepare_index()
+    load_shard()
+
+
+def load_model():
+    if config.EMBED_BACKEND == "local":
+        vec.get_backend()
+
+
+# Model, graph and index (then shard) load concurrently once the server is
+# up; until all are done API routes answer 503 (see /ready).
+startup = Startup("main-startup")
+OPEN_PATHS = ("/ready", "/metrics", "/static/", "/uploads/")
+
+
+@app.on_event("startup")
+async def start():
+    startup.start({"index": load_index, "graph": load_graph, "model": load_model})
+
+
+@app.middleware("http")
+async def require_ready(request, call_next):
+    path = request.url.path
+    if startup.ready or path == "/" or path.startswith(OPEN_PATHS):
+        return await call_next(request)
+    return JSONResponse(status_code=503, content={"error": "Service is starting.", **startup.status()})
+
+
+@app.middleware("http")
+async def record_request(request, call_next):
+    """Per-request latency, Redis round trips and stage spans (also sent
+    back as a Server-Timing header)."""
+    stats = metrics.begin_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    route = getattr(route, "path", "other")
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+    metrics.REQUEST_ROUND_TRIPS.observe(stats.round_trips, route)
+    if stats.spans:
+        response.headers["Server-Timing"] = metrics.server_timing(stats)
+    log.debug("%s %s: %d Redis round trips, spans %s", request.method, request.url.path, stats.round_trips, stats.spans)
+    return response
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.status())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if graph_rank is not None:
+        graph_rank.close()
+    if graph_store is not None:
+        graph_store.close()
+    if vector_shard is not None:
+        vector_shard.close()
+    await r.aclose()
+
+
+async def write_file(path: str, content: bytes):
+    async with await anyio.open_file(path, "wb") as f:
+        await f.write(content)
+
+
+async def read_upload(file: UploadFile, chunk_size: int = config.UPLOAD_CHUNK_BYTES):
+    """Reads an upload chunk by chunk, hashing as it goes, so large bodies
+    are never read in one call. Returns (bytes, sha256 hex digest)."""
+    digest = hashlib.sha256()
+    chunks = []
+    while chunk := await file.read(chunk_size):
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+async def resolve_aliases(keys: list[str]) -> dict:
+    """key -> stored key for content recorded as a near copy (alias mode),
+    so resubmitted bytes are answered without embedding them again."""
+    if near_dups is None or config.DEDUP_MODE != "alias" or not keys:
+        return {}
+    return await near_dups.resolve_many(keys)
+
+
+async def cache_text_vectors(texts: list[str], vectors):
+    """Seeds the embedding cache with freshly embedded texts, so searching
+    for submitted text skips the embedder."""
+    for text, v in zip(texts, vectors):
+        await embedding_cache.put(text_cache_key(text), v)
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -51,111 +205,297 @@ async def submit_task(
     data: Annotated[str, Form(alias="data")] = None,
     file: UploadFile = File(None, alias="file")
 ):
-    print(f"Received submission type: {mtype}")
+    log.debug("Received submission type: %s", mtype)
 
     # Handle text or file uploads
     if mtype == "text":
+        if not data:
+            return {"error": "Text data required for type='text'"}
         content = data
     elif mtype in ("image", "audio"):
         if not file:
             return {"error": "No file uploaded."}
-        file_bytes = await file.read()
-        hash_val = generate_hash(file_bytes)
+        content, hash_val = await read_upload(file)
         filename = f"{hash_val}{os.path.splitext(file.filename)[1]}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-        content = file_path
     else:
         return {"error": "Unsupported type. Use 'text', 'image', or 'audio'."}
 
-    # Get embedding vector
-    v = vec.toVect({"type": mtype, "data": content})
-    if v is None:
-        return {"error": "Failed to create vector."}
-    print("Length of vector:", len(v))
-
-    key = f"doc:{generate_hash(content if mtype == 'text' else file_bytes)}"
+    key = f"doc:{generate_hash(content) if mtype == 'text' else hash_val}"
 
-    if not r.exists(key):
-        db.storeVec(key, v, content if mtype == "text" else filename, r, mtype)
+    # The vector lookup doubles as the exists check: stored content is not re-embedded
+    v = await db.loadVec(key, r, vector_shard)
+    duplicate_of = None
+    if v is None:
+        target = (await resolve_aliases([key])).get(key)
+        v = await db.loadVec(target, r, vector_shard) if target else None
+        if v is not None:
+            key = duplicate_of = target
+    if v is None:
+        v = await run_in_threadpool(vec.toVect, {"type": mtype, "data": content})
+        if v is None:
+            return {"error": "Failed to create vector."}
+        if mtype == "text":
+            await cache_text_vectors([content], [v])
+        duplicate = await near_dups.find(v, vector_shard) if near_dups is not None else None
+        if duplicate is not None:
+            duplicate_of, similarity = duplicate
+            if config.DEDUP_MODE == "reject":
+                return {"error": "Near-duplicate of a stored item.", "duplicate_of": duplicate_of,
+                        "similarity": similarity}
+            # Alias: later submissions of the same bytes resolve without embedding
+            await near_dups.alias({key: duplicate_of})
+            key = duplicate_of
+        else:
+            if mtype != "text":
+                await write_file(os.path.join(UPLOAD_DIR, filename), content)
+            await db.storeVec(key, v, content if mtype == "text" else filename, r, mtype, vector_shard)
+            if near_dups is not None:
+                await near_dups.add(key, v)
 
     # Search neighbors with improved logic
-    result = search_knn(r, v, 10, query_id=key, query_type=mtype)
-    update_graph_connections(semantic_graph, key, result)
+    result = await search.search_knn(r, v, 10, query_id=key, query_type=mtype, shard=vector_shard)
+    update_graph_connections(graph_store, key, mtype, result)
+    await result_cache.bump_generation()
 
+    if duplicate_of is not None:
+        return {"message": f"Near-duplicate {mtype}", "key": key, "duplicate_of": duplicate_of, "neighbors": result}
     return {"message": f"Stored {mtype}", "key": key, "neighbors": result}
 
 
+@app.post("/submit_batch")
+async def submit_batch(
+    texts: Annotated[List[str], Form(alias="data")] = None,
+    files: List[UploadFile] = File(None, alias="file")
+):
+    texts = texts or []
+    files = files or []
+    log.debug("Received batch submission: %d texts, %d files", len(texts), len(files))
+    metrics.BATCH_SIZE.observe(len(texts) + len(files), "submit_batch")
+
+    # (key, mtype, stored data, text or image bytes), deduplicated within the batch
+    items = {}
+    for text in texts:
+        items.setdefault(f"doc:{generate_hash(text)}", ("text", text, text))
+    for file in files:
+        file_bytes, hash_val = await read_upload(file)
+        filename = f"{hash_val}{os.path.splitext(file.filename)[1]}"
+        items.setdefault(f"doc:{hash_val}", ("image", filename, file_bytes))
+
+    keys = list(items)
+    new_keys = [key for key, exists in zip(keys, await db.existsMany(keys, r)) if not exists]
+    if not new_keys:
+        return {"message": "Nothing new to store", "stored": [], "duplicates": keys}
+
+    # Resubmitted near copies resolve to their stored key without embedding
+    aliased = await resolve_aliases(new_keys)
+    if aliased:
+        live = await db.existsMany(list(aliased.values()), r)
+        aliased = {key: target for (key, target), ok in zip(aliased.items(), live) if ok}
+    text_keys = [k for k in new_keys if items[k][0] == "text" and k not in aliased]
+    image_keys = [k for k in new_keys if items[k][0] == "image" and k not in aliased]
+
+    try:
+        text_vecs, image_vecs = await run_in_threadpool(
+            vec.toVectBatch, [items[k][2] for k in text_keys], [items[k][2] for k in image_keys]
+        )
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        log.error("Batch embedding failed: %s", e)
+        return {"error": "Failed to create vector."}
+    await cache_text_vectors([items[k][2] for k in text_keys], text_vecs)
+    ordered_keys = text_keys + image_keys
+    vectors = list(text_vecs) + list(image_vecs)
+
+    # Near copies of stored docs, or of earlier items in this batch
+    near_duplicates = {}
+    if near_dups is not None and ordered_keys:
+        found = await near_dups.find_many(vectors, vector_shard)
+        for key, match in zip(ordered_keys, found):
+            if match is not None:
+                target = match[0] if isinstance(match[0], str) else ordered_keys[match[0]]
+                near_duplicates[key] = target
+        if near_duplicates and config.DEDUP_MODE == "alias":
+            await near_dups.alias(near_duplicates)
+        vectors = [v for key, v in zip(ordered_keys, vectors) if key not in near_duplicates]
+        ordered_keys = [key for key in ordered_keys if key not in near_duplicates]
+    near_duplicates.update(aliased)
+    if not ordered_keys:
+        return {"message": "Nothing new to store", "stored": [],
+                "duplicates": [k for k in keys if k not in set(new_keys)], "near_duplicates": near_duplicates}
+    types = [items[k][0] for k in ordered_keys]
+    for key, mtype in zip(ordered_keys, types):
+        if mtype == "image":
+            await write_file(os.path.join(UPLOAD_DIR, items[key][1]), items[key][2])
+
+    await db.storeVecBatch(
+        [(key, v, items[key][1], mtype) for key, v, mtype in zip(ordered_keys, vectors, types)], r, vector_shard
+    )
+    neighbors = await search.search_knn_many(
+        r, vectors, 10, query_ids=ordered_keys, query_types=types, shard=vector_shard
+    )
+    if near_dups is not None:
+        await near_dups.add_many(ordered_keys, vectors)
+    update_graph_connections_batch(graph_store, list(zip(ordered_keys, types, neighbors)))
+    await result_cache.bump_generation()
+
+    stored = set(new_keys)
+    duplicates = [key for key in keys if key not in stored]
+    response = {"message": f"Stored {len(ordered_keys)} items", "stored": ordered_keys, "duplicates": duplicates}
+    if near_duplicates:
+        response["near_duplicates"] = near_duplicates
+    return response
+
+
 @app.post("/search")
 async def search_endpoint_with_graph(
     mtype: Annotated[str, Form(alias="type")],
     query: Annotated[str, Form(alias="query")] = None,
-    file: UploadFile = File(None, alias="file")
+    file: UploadFile = File(None, alias="file"),
+    top_k: Annotated[int, Form()] = 20,
+    depth: Annotated[int, Form()] = config.GRAPH_EXPANSION_DEPTH,
+    ef_runtime: Annotated[int, Form()] = None,
+    same_k: Annotated[int, Form()] = None,
+    cross_k: Annotated[int, Form()] = None,
+    use_cache: Annotated[bool, Form(alias="cache")] = True
 ):
-    print(f"Graph-augmented search: type={mtype}")
-    top_k = 20
+    log.debug("Graph-augmented search: type=%s", mtype)
     if mtype == "text":
         if not query:
             return {"error": "Text query required for type='text'"}
-        query_vec = vec.toVect({"type": "text", "data": query})
+        query_vec = await embedding_cache.get_or_compute(
+            text_cache_key(query),
+            lambda: run_in_threadpool(vec.toVect, {"type": "text", "data": query})
+        )
     elif mtype in ("image", "audio"):
         if not file:
             return {"error": f"File required for type='{mtype}'"}
-        file_bytes = await file.read()
-        temp_filename = f"temp_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, temp_filename)
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-        query_vec = vec.toVect({"type": mtype, "data": file_path})
-        os.remove(file_path)
+        file_bytes, hash_val = await read_upload(file)
+        query_vec = await embedding_cache.get_or_compute(
+            f"{mtype}:{hash_val}",
+            lambda: run_in_threadpool(vec.toVect, {"type": mtype, "data": file_bytes})
+        )
     else:
         return {"error": "Unsupported type. Use 'text', 'image', or 'audio'."}
 
     if query_vec is None:
         return {"error": "Failed to create query vector."}
 
-    initial_results = search_knn(r, query_vec, k=top_k, query_type=mtype)
-    
+    if use_cache:
+        # The rank version keys out results scored with older priors
+        cache_key = result_cache.make_key(query_vec, top_k, mtype, depth, ef_runtime, same_k, cross_k,
+                                          graph_rank.version if graph_rank else None)
+        cached, generation = await result_cache.get(cache_key)
+        if cached is not None:
+            return {"results": cached, "cached": True}
+
+    try:
+        initial_results = await search.search_knn(
+            r, query_vec, k=top_k, query_type=mtype, ef_runtime=ef_runtime,
+            same_k=same_k, cross_k=cross_k, shard=vector_shard
+        )
+    except ValueError as e:
+        return {"error": str(e)}
 
-    expanded_results = search.search_with_graph_expansion(
-        initial_results, semantic_graph, r, k=top_k
+    expanded_results = await search.search_with_graph_expansion(
+        initial_results, semantic_graph, r, k=top_k, depth=depth, priors=graph_rank, query_type=mtype
     )
 
-    return {"results": expanded_results}
+    if use_cache:
+        await result_cache.put(cache_key, expanded_results, generation)
+
+    return {"results": expanded_results, "cached": False}
+
+
+@app.post("/search_batch")
+async def search_batch(
+    queries: Annotated[List[str], Form(alias="query")] = None,
+    files: List[UploadFile] = File(None, alias="file"),
+    top_k: Annotated[int, Form()] = 20,
+    depth: Annotated[int, Form()] = config.GRAPH_EXPANSION_DEPTH,
+    ef_runtime: Annotated[int, Form()] = None,
+    same_k: Annotated[int, Form()] = None,
+    cross_k: Annotated[int, Form()] = None
+):
+    """Answers many text and/or image queries with one embedding pass, one
+    KNN pipeline and one shared graph expansion. Results come back in input
+    order, texts first."""
+    queries = queries or []
+    files = files or []
+    if not queries and not files:
+        return {"error": "At least one query or file is required."}
+    log.debug("Batch search: %d texts, %d files", len(queries), len(files))
+    metrics.BATCH_SIZE.observe(len(queries) + len(files), "search_batch")
+
+    text_keys = [text_cache_key(q) for q in queries]
+    text_vecs = [await embedding_cache.get(key) for key in text_keys]
+    missing = [i for i, v in enumerate(text_vecs) if v is None]
+    image_bytes = [(await read_upload(file))[0] for file in files]
+
+    try:
+        new_text_vecs, image_vecs = await run_in_threadpool(
+            vec.toVectBatch, [queries[i] for i in missing], image_bytes
+        )
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        log.error("Batch embedding failed: %s", e)
+        return {"error": "Failed to create vector."}
+    for i, v in zip(missing, new_text_vecs):
+        text_vecs[i] = await embedding_cache.put(text_keys[i], v)
+
+    vectors = text_vecs + list(image_vecs)
+    types = ["text"] * len(queries) + ["image"] * len(files)
+    try:
+        initial_results = await search.search_knn_many(
+            r, vectors, top_k, query_types=types, ef_runtime=ef_runtime,
+            same_k=same_k, cross_k=cross_k, shard=vector_shard
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+    expanded_results = await search.search_with_graph_expansion_many(
+        initial_results, semantic_graph, r, k=top_k, depth=depth, priors=graph_rank, query_types=types
+    )
+
+    labels = queries + [file.filename for file in files]
+    return {"results": [
+        {"query": label, "type": mtype, "results": results}
+        for label, mtype, results in zip(labels, types, expanded_results)
+    ]}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+    }
 
 
 @app.get("/graph")
-async def get_graph():
+async def get_graph(max_nodes: int = None, min_degree: int = 0, min_score: float = 0.0):
     net = Network(height="100%", width="100%", bgcolor="#121212", font_color="white")
     net.barnes_hut(gravity=-2000, spring_length=200, spring_strength=0.02)
 
     type_colors = {"text": "#4db6ff", "image": "#76ff7a", "audio": "#ff9800"}
 
-    for node in semantic_graph.nodes:
-        node_data = r.hget(node, "data")
-        node_type = r.hget(node, "type")
-        label = node_data.decode() if node_data else node
-        ntype = node_type.decode() if node_type else "unknown"
-
-        net.add_node(
-            node,
-            label=label,
-            color=type_colors.get(ntype, "#9e9e9e"),
-            shape="dot",
-            size=25,
-            font={"size": 14},
-            title=f"Type: {ntype}"
-        )
-
-    for u, v, data in semantic_graph.edges(data=True):
-        score = data.get("score", 0)
-        net.add_edge(
-            u, v,
-            title=f"Score: {score:.4f}",
-            color="rgba(255,255,255,0.4)",
-            smooth={"type": "dynamic"}
-        )
+    added = set()
+    async for record in graph_export.iter_graph(r, semantic_graph, 0, max_nodes, min_degree, min_score):
+        if record["kind"] == "node":
+            added.add(record["id"])
+            ntype = record["type"]
+            net.add_node(
+                record["id"],
+                label=record["data"],
+                color=type_colors.get(ntype, "#9e9e9e"),
+                shape="dot",
+                size=25,
+                font={"size": 14},
+                title=f"Type: {ntype}"
+            )
+        elif record["kind"] == "edge" and record["to"] in added:
+            net.add_edge(
+                record["from"], record["to"],
+                title=f"Score: {record['score']:.4f}",
+                color="rgba(255,255,255,0.4)",
+                smooth={"type": "dynamic"}
+            )
 
     html_content = net.generate_html(notebook=False)
     full_screen_css = """
@@ -168,115 +508,75 @@ async def get_graph():
     return HTMLResponse(content=html_content)
 
 @app.get("/graph-data")
-async def get_graph_data():
+async def get_graph_data(cursor: int = 0, limit: int = None, min_degree: int = 0, min_score: float = 0.0):
     nodes_data = []
-    valid_node_ids = set()
-
-    pipe = r.pipeline(transaction=False)
-    for node_id in semantic_graph.nodes:
-        pipe.hgetall(node_id)
-    
-    redis_results = pipe.execute()
-
-    for i, node_id in enumerate(semantic_graph.nodes):
-        redis_data = redis_results[i]
-        
-        data_val = redis_data.get(b'data')
-        type_val = redis_data.get(b'type')
-
-        if data_val and type_val:
-            nodes_data.append({
-                "id": node_id,
-                "data": data_val.decode('utf-8'),
-                "type": type_val.decode('utf-8')
-            })
-            valid_node_ids.add(node_id)
-    
     edges_data = []
-    for u, v, data in semantic_graph.edges(data=True):
-        if u in valid_node_ids and v in valid_node_ids:
-            edges_data.append({
-                "from": u,
-                "to": v,
-                "score": data.get("score", 0)
-            })
-        
-    return JSONResponse(content={"nodes": nodes_data, "edges": edges_data})
-
-def search_knn(r, query_vector, k=5, query_id=None, query_type=None):
-    query_vector_bytes = vector_to_bytes(query_vector)
-    q = (
-        Query(f"*=>[KNN {k*6} @embedding $vector AS vector_score]")
-        .sort_by("vector_score")
-        .return_fields("id", "data", "type", "vector_score")
-        .dialect(2)
-    )
-    params = {"vector": query_vector_bytes}
-    results = r.ft("idx:docs").search(q, query_params=params)
-
-    same_mod = []
-    cross_mod = []
-
-    for doc in results.docs:
-        similarity = 1 - float(doc.vector_score)
-
-        if query_id and doc.id == query_id:
-            similarity = 1.0
-
-        doc_type = doc.type
-
-        # Split results
-        if query_type and doc_type != query_type:
-            cross_mod.append({
-                "id": doc.id,
-                "data": doc.data,
-                "type": doc.type,
-                "score": similarity
-            })
+    next_cursor = None
+
+    async for record in graph_export.iter_graph(r, semantic_graph, cursor, limit, min_degree, min_score):
+        kind = record.pop("kind")
+        if kind == "node":
+            nodes_data.append(record)
+        elif kind == "edge":
+            edges_data.append(record)
         else:
-            same_mod.append({
-                "id": doc.id,
-                "data": doc.data,
-                "type": doc.type,
-                "score": similarity
-            })
+            next_cursor = record["next_cursor"]
+
+    # Each edge comes on the page of its later endpoint, so its other end may
+    # be on an earlier page; only drop edges to nodes missing from Redis
+    present = {n["id"] for n in nodes_data}
+    others = list({e["to"] for e in edges_data if e["to"] not in present})
+    if others:
+        present.update(key for key, exists in zip(others, await db.existsMany(others, r)) if exists)
+    edges_data = [e for e in edges_data if e["from"] in present and e["to"] in present]
 
-    # Sort by similarity
-    same_mod.sort(key=lambda x: x["score"], reverse=True)
-    cross_mod.sort(key=lambda x: x["score"], reverse=True)
+    return JSONResponse(content={"nodes": nodes_data, "edges": edges_data, "next_cursor": next_cursor})
 
-    same_keep = same_mod[:k // 2] 
-    cross_keep = cross_mod[:k // 2] 
 
-    final_results = (same_keep + cross_keep)[:k]
-    final_results.sort(key=lambda x: x["score"], reverse=True)
+@app.get("/graph-data/stream")
+async def stream_graph_data(cursor: int = 0, limit: int = None, min_degree: int = 0, min_score: float = 0.0):
+    """NDJSON export: one node or edge record per line, fetched and sent a
+    chunk at a time, ending with {"kind": "end", "next_cursor": ...}."""
+    async def lines():
+        async for record in graph_export.iter_graph(r, semantic_graph, cursor, limit, min_degree, min_score):
+            yield json.dumps(record) + "\n"
 
-    return final_results
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
+@app.get("/graph/stats")
+async def get_graph_stats():
+    with graph_store.lock:
+        stats = graph_export.degree_stats(semantic_graph)
+    return {**stats, "evictions": graph_store.evictions, "rank": graph_rank.stats() if graph_rank else None}
 
-def update_graph_connections(graph: nx.Graph, source_key: str, neighbors: list[dict]):
-    graph.add_node(source_key)
-    source_type_bytes = r.hget(source_key, "type")
-    source_type = source_type_bytes.decode() if source_type_bytes else None
 
-    for n in neighbors:
-        target_id = n["id"]
-        if target_id == source_key:
-            continue
+@app.get("/graph/ego")
+async def get_ego_graph(node: str, radius: int = 1, max_nodes: int = 200, min_score: float = 0.0):
+    return await graph_export.ego_subgraph(r, semantic_graph, node, radius, max_nodes, min_score)
 
-        target_type_bytes = r.hget(target_id, "type")
-        target_type = target_type_bytes.decode() if target_type_bytes else None
+def update_graph_connections(store: GraphStore, source_key: str, source_type: str, neighbors: list[dict]):
+    update_graph_connections_batch(store, [(source_key, source_type, neighbors)])
 
-        score = n["score"]
-        if source_type and target_type and source_type != target_type:
-            score = max(score, 0.8) 
 
-        graph.add_node(target_id)
-        graph.add_edge(source_key, target_id, score=score)
+@metrics.timed("graph_update")
+def update_graph_connections_batch(store: GraphStore, entries: list[tuple]):
+    """Adds the edges for many (source_key, source_type, neighbors) entries at
+    once, within the graph's degree bound. Neighbor types come from the
+    search results, so no per-neighbor Redis lookups are needed."""
+    edge_count = 0
+    for source_key, source_type, neighbors in entries:
+        store.add_node(source_key)
+        for n in neighbors:
+            target_id = n["id"]
+            if target_id == source_key:
+                continue
+            score = n["score"]
+            if source_type != n["type"]:
+                score = max(score, 0.8)
+            edge_count += store.connect(source_key, target_id, score)
 
-    save_graph()
-    print(f"✅ Graph updated: {source_key} connected to {len(neighbors)} neighbors (boosted cross-modal).")
+    log.debug("Graph updated: %d nodes, %d edges.", len(entries), edge_count)
 
 
 def generate_hash(data) -> str:
@@ -287,5 +587,7 @@ def generate_hash(data) -> str:
     return hashlib.sha256(encoded_data).hexdigest()
 
 
-def vector_to_bytes(vector: List[float]) -> bytes:
-    return np.array(vector, dtype=np.float32).tobytes()
+def text_cache_key(text: str) -> str:
+    """Embedding cache key for a text: equal after normalization, equal key."""
+    return f"text:{generate_hash(normalize_text(text))}"
+
@@ -0,0 +1,179 @@
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+import config
+
+# Seconds; covers sub-millisecond Redis calls up to slow CPU inference
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+_registry = []
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self, *labels) -> tuple:
+        """(count, sum) observed so far for one label set."""
+        with self._lock:
+            series = self._series.get(labels)
+            return (series[-1], series[-2]) if series else (0, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+def setup_logging(level: str = config.LOG_LEVEL):
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent per pipeline stage", ("stage",))
+REQUEST_SECONDS = Histogram("request_seconds", "Request latency by route", ("route",))
+REQUEST_ROUND_TRIPS = Histogram("request_redis_round_trips", "Redis round trips per request", ("route",),
+                                buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55))
+REDIS_ROUND_TRIPS = Counter("redis_round_trips_total", "Redis round trips (a pipeline counts once)")
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "result"))
+BATCH_SIZE = Histogram("batch_size", "Items per batch", ("batch",), buckets=SIZE_BUCKETS)
+GRAPH_EVICTIONS = Counter("graph_edge_evictions_total", "Edges evicted by the graph degree bound")
+DEDUP_CHECKS = Counter("dedup_checks_total", "Ingested items checked by the near-duplicate gate", ("result",))
+
+
+class RequestStats:
+    """Per-request span timings and Redis round trips."""
+
+    def __init__(self):
+        self.spans: dict[str, float] = {}
+        self.round_trips = 0
+
+
+_request: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+def begin_request() -> RequestStats:
+    stats = RequestStats()
+    _request.set(stats)
+    return stats
+
+
+def redis_round_trip():
+    REDIS_ROUND_TRIPS.inc()
+    stats = _request.get()
+    if stats is not None:
+        stats.round_trips += 1
+
+
+class span:
+    """Times a block into STAGE_SECONDS{stage=name} and, inside a request,
+    into that request's span breakdown. Usable in sync and async code."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        stats = _request.get()
+        if stats is not None:
+            stats.spans[self.stage] = stats.spans.get(self.stage, 0.0) + elapsed
+
+
+def timed(stage: str):
+    """Decorator form of span for sync and async functions."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+def server_timing(stats: RequestStats) -> str:
+    """Server-Timing header value for a request's spans (milliseconds)."""
+    return ", ".join(f"{stage};dur={secs * 1000:.2f}" for stage, secs in stats.spans.items())
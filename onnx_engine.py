@@ -0,0 +1,132 @@
+from transformers import CLIPProcessor
+from PIL import Image
+import numpy as np
+import onnxruntime as ort
+import argparse
+import io
+import logging
+import os
+import config
+import metrics
+from clip_engine import resolve_model_path, warmup_image
+
+log = logging.getLogger(__name__)
+
+TEXT_FILE = "text.onnx"
+VISION_FILE = "vision.onnx"
+
+
+def _int8_name(filename: str) -> str:
+    return filename.replace(".onnx", ".int8.onnx")
+
+
+def _normalize(emb: np.ndarray) -> np.ndarray:
+    emb = emb.astype(np.float32)
+    return emb / np.maximum(np.linalg.norm(emb, axis=-1, keepdims=True), 1e-12)
+
+
+def export(model_name: str = config.CLIP_MODEL_NAME, out_dir: str = config.ONNX_DIR, int8: bool = True):
+    """Exports the CLIP text and vision towers (projection included) to ONNX
+    with dynamic batch/sequence axes, plus dynamically quantized int8 copies
+    when `int8` is set. Needs torch; serving from the exports does not."""
+    import torch
+    from transformers import CLIPModel
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    path = resolve_model_path(model_name)
+    model = CLIPModel.from_pretrained(path).eval()
+    proc = CLIPProcessor.from_pretrained(path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    class TextTower(torch.nn.Module):
+        def forward(self, input_ids, attention_mask):
+            return model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    class VisionTower(torch.nn.Module):
+        def forward(self, pixel_values):
+            return model.get_image_features(pixel_values=pixel_values)
+
+    text_inputs = proc(text=["an export sample", "two"], return_tensors="pt", padding=True)
+    image_inputs = proc(images=[Image.open(io.BytesIO(warmup_image()))], return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            TextTower(), (text_inputs["input_ids"], text_inputs["attention_mask"]),
+            os.path.join(out_dir, TEXT_FILE),
+            input_names=["input_ids", "attention_mask"], output_names=["embeds"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                          "embeds": {0: "batch"}},
+            opset_version=17,
+        )
+        torch.onnx.export(
+            VisionTower(), (image_inputs["pixel_values"],),
+            os.path.join(out_dir, VISION_FILE),
+            input_names=["pixel_values"], output_names=["embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embeds": {0: "batch"}},
+            opset_version=17,
+        )
+    proc.save_pretrained(out_dir)
+
+    if int8:
+        for filename in (TEXT_FILE, VISION_FILE):
+            quantize_dynamic(os.path.join(out_dir, filename), os.path.join(out_dir, _int8_name(filename)),
+                             weight_type=QuantType.QInt8)
+    log.info("Exported %s to %s%s", model_name, out_dir, " (+ int8)" if int8 else "")
+
+
+def session_options(intra_op: int = config.ORT_INTRA_OP_THREADS,
+                    inter_op: int = config.ORT_INTER_OP_THREADS) -> ort.SessionOptions:
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op:
+        opts.intra_op_num_threads = intra_op
+    if inter_op:
+        opts.inter_op_num_threads = inter_op
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return opts
+
+
+class OnnxClipEngine:
+    """CLIP encoder on ONNX Runtime (CPU) with the same interface as
+    ClipEngine. Exports the towers to `onnx_dir` on first use if needed."""
+
+    def __init__(self, onnx_dir: str = config.ONNX_DIR, int8: bool = config.ONNX_INT8,
+                 intra_op: int = config.ORT_INTRA_OP_THREADS, inter_op: int = config.ORT_INTER_OP_THREADS):
+        text_file, vision_file = (_int8_name(TEXT_FILE), _int8_name(VISION_FILE)) if int8 else (TEXT_FILE, VISION_FILE)
+        if not os.path.exists(os.path.join(onnx_dir, text_file)) or \
+                not os.path.exists(os.path.join(onnx_dir, vision_file)):
+            export(out_dir=onnx_dir, int8=int8)
+
+        opts = session_options(intra_op, inter_op)
+        providers = ["CPUExecutionProvider"]
+        self.text = ort.InferenceSession(os.path.join(onnx_dir, text_file), opts, providers=providers)
+        self.vision = ort.InferenceSession(os.path.join(onnx_dir, vision_file), opts, providers=providers)
+        self.proc = CLIPProcessor.from_pretrained(onnx_dir)
+
+    def warmup(self):
+        self.embed_texts(["warm-up"])
+        self.embed_images([warmup_image()])
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        inputs = self.proc(text=texts, return_tensors="np", padding=True, truncation=True)
+        feeds = {"input_ids": inputs["input_ids"].astype(np.int64),
+                 "attention_mask": inputs["attention_mask"].astype(np.int64)}
+        return _normalize(self.text.run(None, feeds)[0])
+
+    def embed_images(self, images: list[bytes]) -> np.ndarray:
+        pil_images = [Image.open(io.BytesIO(b)).convert('RGB') for b in images]
+        inputs = self.proc(images=pil_images, return_tensors="np")
+        return self.embed_pixels(inputs["pixel_values"])
+
+    def embed_pixels(self, pixel_values: np.ndarray) -> np.ndarray:
+        feeds = {"pixel_values": np.ascontiguousarray(pixel_values, dtype=np.float32)}
+        return _normalize(self.vision.run(None, feeds)[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the CLIP towers to ONNX")
+    parser.add_argument("--model", default=config.CLIP_MODEL_NAME)
+    parser.add_argument("--out", default=config.ONNX_DIR)
+    parser.add_argument("--no-int8", action="store_true", help="skip the dynamically quantized copies")
+    args = parser.parse_args()
+    metrics.setup_logging()
+    export(args.model, args.out, int8=not args.no_int8)
@@ -0,0 +1,65 @@
+import io
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+import config
+
+# CLIPImageProcessor defaults for the ViT-B models
+CLIP_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+
+def preprocess_image(data: bytes, size: int = CLIP_SIZE) -> np.ndarray:
+    """Decodes an image file into CLIP pixel_values (3, size, size): resize
+    the short side to `size` (bicubic), center crop, scale and normalize.
+    JPEGs are decoded in draft mode, letting libjpeg downscale by up to 8x
+    during decoding instead of materializing the full-size bitmap."""
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size))
+    img = img.convert("RGB")
+
+    w, h = img.size
+    scale = size / min(w, h)
+    img = img.resize((max(size, round(w * scale)), max(size, round(h * scale))), Image.BICUBIC)
+    w, h = img.size
+    left, top = (w - size) // 2, (h - size) // 2
+    img = img.crop((left, top, left + size, top + size))
+
+    arr = np.asarray(img, dtype=np.float32) / 255.0
+    return ((arr - CLIP_MEAN) / CLIP_STD).transpose(2, 0, 1)
+
+
+class ImagePreprocessor:
+    """Decodes and preprocesses images in a process pool so the model thread
+    only ever sees ready pixel_values. With 0 workers it runs inline."""
+
+    def __init__(self, workers: int = config.PREPROCESS_WORKERS, size: int = CLIP_SIZE):
+        self.size = size
+        self._pool = None
+        if workers > 0:
+            # Fork all workers now, before the caller starts any threads
+            self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+            self._pool.submit(int).result()
+
+    def submit(self, data: bytes) -> Future:
+        if self._pool is not None:
+            return self._pool.submit(preprocess_image, data, self.size)
+        fut = Future()
+        try:
+            fut.set_result(preprocess_image(data, self.size))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def map(self, images: list[bytes]) -> np.ndarray:
+        """(n, 3, size, size) pixel_values for `images`, preprocessed in parallel."""
+        if not images:
+            return np.empty((0, 3, self.size, self.size), dtype=np.float32)
+        return np.stack([fut.result() for fut in [self.submit(b) for b in images]])
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
@@ -0,0 +1,44 @@
+import numpy as np
+import config
+
+INDEX_TYPES = {"float32": "FLOAT32", "float16": "FLOAT16", "int8": "INT8"}
+
+
+def index_type(storage: str = config.VECTOR_STORAGE) -> str:
+    if storage not in INDEX_TYPES:
+        raise ValueError(f"Unsupported VECTOR_STORAGE: {storage}")
+    return INDEX_TYPES[storage]
+
+
+def scale_field(field: str = "embedding") -> str:
+    """Hash field holding the int8 scale for vector field `field`."""
+    return "scale" if field == "embedding" else f"{field}_scale"
+
+
+def encode(vector, storage: str = config.VECTOR_STORAGE, field: str = "embedding") -> dict:
+    """Hash fields holding `vector` in the given storage format. int8 codes
+    are round(v / scale) with scale = max|v| / 127, stored alongside. The
+    index uses cosine distance, which ignores the per-vector scale, so the
+    codes can be searched directly."""
+    v = np.asarray(vector, dtype=np.float32)
+    if storage == "float16":
+        return {field: v.astype(np.float16).tobytes()}
+    if storage == "int8":
+        scale = float(np.abs(v).max()) / 127.0 or 1.0
+        codes = np.clip(np.rint(v / scale), -127, 127).astype(np.int8)
+        return {field: codes.tobytes(), scale_field(field): scale}
+    return {field: v.tobytes()}
+
+
+def decode(blob: bytes, scale=None, storage: str = config.VECTOR_STORAGE) -> np.ndarray:
+    """Float32 vector from a vector field (lossy for compressed modes)."""
+    if storage == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if storage == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * float(scale or 1.0)
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def query_bytes(vector, storage: str = config.VECTOR_STORAGE) -> bytes:
+    """Query blob matching the index's vector type."""
+    return next(iter(encode(vector, storage).values()))
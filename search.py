@@ -1,47 +1,274 @@
-from redis.commands.search.query import Query
+import asyncio
+from collections import deque
+import heapq
 import numpy as np
-from typing import List, Dict
+import redis
+import config
+import db
+import metrics
+import quantize
+from graph_export import weighted_neighbors
 
-def search_with_graph_expansion(initial_results, graph, r, k=10, depth=1):
-    expanded_results = {item['id']: item for item in initial_results}
-    
-    queue = list(initial_results)
+def _knn_command(index, filter_expr, k, vector_bytes, ef_runtime=None):
+    """Raw FT.SEARCH arguments for a (pre-filtered) KNN query, so several
+    of them can be queued on one pipeline."""
+    params = ["vector", vector_bytes]
+    ef_clause = ""
+    if ef_runtime:
+        ef_clause = " EF_RUNTIME $ef"
+        params += ["ef", ef_runtime]
+    return (
+        "FT.SEARCH", index,
+        f"{filter_expr}=>[KNN {k} @embedding $vector{ef_clause} AS vector_score]",
+        "PARAMS", len(params), *params,
+        "SORTBY", "vector_score",
+        "RETURN", 3, "data", "type", "vector_score",
+        "LIMIT", 0, k,
+        "DIALECT", 2,
+    )
+
+
+def _parse_search_reply(reply, query_id=None):
+    """Turns a RESP2 FT.SEARCH reply [total, id, [field, value, ...], ...]
+    into result dicts with cosine similarity scores."""
+    results = []
+    for i in range(1, len(reply), 2):
+        doc_id = reply[i].decode() if isinstance(reply[i], bytes) else reply[i]
+        raw = reply[i + 1]
+        fields = {raw[j].decode(): raw[j + 1] for j in range(0, len(raw), 2)}
+        similarity = 1 - float(fields["vector_score"])
+        if query_id and doc_id == query_id:
+            similarity = 1.0
+        results.append({
+            "id": doc_id,
+            "data": fields["data"].decode('utf-8'),
+            "type": fields["type"].decode('utf-8'),
+            "score": similarity
+        })
+    return results
+
+
+def _escape_tag(value: str) -> str:
+    return "".join(f"\\{c}" if not c.isalnum() and c != "_" else c for c in value)
+
+
+def knn_commands(query_vector, k=5, query_type=None, ef_runtime=None, same_k=None, cross_k=None,
+                 fetch_factor=1, storage=config.VECTOR_STORAGE):
+    """(command, quota) pairs for one query. With a query type, one
+    TAG-filtered KNN fetches the same-modality bucket and its complement
+    fetches the cross-modal bucket, so each bucket gets exactly its quota.
+    Each command fetches quota * fetch_factor candidates. The query vector
+    is encoded in the index's `storage` format."""
+    vector_bytes = quantize.query_bytes(query_vector, storage)
+    if not query_type:
+        return [(_knn_command(config.INDEX_ALIAS, "*", k * fetch_factor, vector_bytes, ef_runtime), k)]
+
+    same_k = k // 2 if same_k is None else same_k
+    cross_k = k // 2 if cross_k is None else cross_k
+    tag = _escape_tag(query_type)
+    commands = []
+    for filter_expr, quota in ((f"(@type:{{{tag}}})", same_k), (f"(-@type:{{{tag}}})", cross_k)):
+        if quota > 0:
+            commands.append((_knn_command(config.INDEX_ALIAS, filter_expr, quota * fetch_factor,
+                                          vector_bytes, ef_runtime), quota))
+    return commands
+
+
+def rerank_exact(results, query_vector, shard):
+    """Replaces approximate scores with exact cosine similarity computed from
+    the full-precision vectors in `shard`. Candidates missing from the shard
+    keep their index score."""
+    if not results:
+        return results
+    vectors, found = shard.get_many([item["id"] for item in results])
+    exact = vectors @ np.asarray(query_vector, dtype=np.float32)
+    for item, ok, score in zip(results, found.tolist(), exact.tolist()):
+        if ok:
+            item["score"] = score
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results
+
+
+def merge_knn_replies(replies, quotas, query_id=None, query_vector=None, shard=None):
+    merged = []
+    for reply, quota in zip(replies, quotas):
+        bucket = _parse_search_reply(reply, query_id)
+        if shard is not None:
+            bucket = rerank_exact(bucket, query_vector, shard)
+        merged.extend(bucket[:quota])
+    merged.sort(key=lambda x: x["score"], reverse=True)
+    return merged
+
+
+async def search_knn(r, query_vector, k=5, query_id=None, query_type=None, ef_runtime=None,
+                     same_k=None, cross_k=None, shard=None):
+    return (await search_knn_many(r, [query_vector], k, [query_id], [query_type], ef_runtime,
+                                  same_k, cross_k, shard))[0]
+
+
+@metrics.timed("knn")
+async def search_knn_many(r, query_vectors, k=5, query_ids=None, query_types=None, ef_runtime=None,
+                          same_k=None, cross_k=None, shard=None):
+    """Runs the KNN queries for many vectors in a single pipeline and returns
+    one merged result list per vector. With compressed vector storage and a
+    shard, each bucket is over-fetched by RERANK_FACTOR and re-ranked exactly."""
+    query_ids = query_ids or [None] * len(query_vectors)
+    query_types = query_types or [None] * len(query_vectors)
+    if config.KNN_BACKEND == "shard" and shard is not None:
+        return await search_shard_many(r, shard, query_vectors, k, query_ids, query_types, same_k, cross_k)
+    layout = await db.live_layout(r)
+    try:
+        spans, replies = await _run_knn(r, layout, query_vectors, k, query_types, ef_runtime,
+                                        same_k, cross_k, shard)
+    except redis.ResponseError:
+        # The alias may have just moved to an index in another storage format
+        layout = await db.live_layout(r, refresh=True)
+        spans, replies = await _run_knn(r, layout, query_vectors, k, query_types, ef_runtime,
+                                        same_k, cross_k, shard)
+    if layout["storage"] == "float32":
+        shard = None
+
+    results, pos = [], 0
+    for quotas, query_id, query_vector in zip(spans, query_ids, query_vectors):
+        n = len(quotas)
+        results.append(merge_knn_replies(replies[pos:pos + n], quotas, query_id, query_vector, shard))
+        pos += n
+    return results
+
+
+async def _run_knn(r, layout, query_vectors, k, query_types, ef_runtime, same_k, cross_k, shard):
+    if ef_runtime and layout["algorithm"] != "HNSW":
+        raise ValueError("ef_runtime only applies to an HNSW index; the live index is FLAT.")
+    fetch_factor = config.RERANK_FACTOR if shard is not None and layout["storage"] != "float32" else 1
+    pipe = r.pipeline(transaction=False)
+    spans = []
+    for query_vector, query_type in zip(query_vectors, query_types):
+        commands = knn_commands(query_vector, k, query_type, ef_runtime, same_k, cross_k, fetch_factor,
+                                layout["storage"])
+        for command, _ in commands:
+            pipe.execute_command(*command)
+        spans.append([quota for _, quota in commands])
+    return spans, (await pipe.execute() if spans else [])
+
+
+async def search_shard_many(r, shard, query_vectors, k=5, query_ids=None, query_types=None,
+                            same_k=None, cross_k=None):
+    """KNN against the local vector shard: one matrix product for all
+    queries (off the event loop), then one pipelined HMGET of `data` for
+    every distinct hit."""
+    query_ids = query_ids or [None] * len(query_vectors)
+    hits = await asyncio.to_thread(shard.search, np.asarray(query_vectors, dtype=np.float32), k,
+                                   query_types, same_k, cross_k)
+
+    doc_ids = list({doc_id for per_query in hits for doc_id, _, _ in per_query})
+    pipe = r.pipeline(transaction=False)
+    for doc_id in doc_ids:
+        pipe.hget(doc_id, "data")
+    data = dict(zip(doc_ids, await pipe.execute() if doc_ids else []))
+
+    results = []
+    for per_query, query_id in zip(hits, query_ids):
+        results.append([{
+            "id": doc_id,
+            "data": data[doc_id].decode('utf-8'),
+            "type": mtype,
+            "score": 1.0 if query_id and doc_id == query_id else score
+        } for doc_id, mtype, score in per_query if data.get(doc_id)])
+    return results
+
+
+async def search_with_graph_expansion(initial_results, graph, r, k=10, depth=config.GRAPH_EXPANSION_DEPTH,
+                                      fan_out=config.GRAPH_FAN_OUT, decay=config.GRAPH_DECAY,
+                                      priors=None, query_type=None):
+    """Level-synchronous BFS over the semantic graph starting from the KNN hits.
+
+    Each level scores its unseen neighbors as parent_score * edge_score * decay
+    (keeping at most `fan_out` per parent), then fetches the whole frontier
+    with one pipelined HMGET of `data` and `type`. Redis round trips therefore
+    scale with `depth`, not with the number of neighbors.
+
+    With `priors` (a graph_rank.GraphRank), the final ranking blends each
+    result's score with its precomputed centrality for `query_type`. The
+    result then also carries that `prior`.
+    """
+    return (await search_with_graph_expansion_many([initial_results], graph, r, k, depth,
+                                                   fan_out, decay, priors, [query_type]))[0]
+
+
+def _frontier_candidates(frontier, expanded_results, graph, fan_out, decay):
+    candidates = {}
+    while frontier:
+        current_node_item = frontier.popleft()
+        node_id = current_node_item['id']
+        if node_id not in graph:
+            continue
+
+        original_score = current_node_item.get('score', 0.5)
+        scored = []
+        # Neighbors and scores come from one read, so a concurrent merge or
+        # eviction cannot leave a listed neighbor without edge data
+        for neighbor_id, edge_weight in weighted_neighbors(graph, node_id):
+            if neighbor_id in expanded_results:
+                continue
+            scored.append((original_score * edge_weight * decay, neighbor_id))
+        if fan_out and len(scored) > fan_out:
+            scored = heapq.nlargest(fan_out, scored)
+
+        for new_score, neighbor_id in scored:
+            if new_score > candidates.get(neighbor_id, float("-inf")):
+                candidates[neighbor_id] = new_score
+    return candidates
+
+
+def _apply_priors(expanded, priors, query_type):
+    for item in expanded.values():
+        prior = priors.prior(item['id'], query_type)
+        if prior is not None:
+            item['prior'] = prior
+            item['score'] = priors.blend(item['score'], prior)
+
+
+@metrics.timed("expand")
+async def search_with_graph_expansion_many(initial_results_list, graph, r, k=10,
+                                           depth=config.GRAPH_EXPANSION_DEPTH,
+                                           fan_out=config.GRAPH_FAN_OUT, decay=config.GRAPH_DECAY,
+                                           priors=None, query_types=None):
+    """Graph expansion for several queries at once. Every BFS level fetches
+    the union of all queries' frontiers with one pipelined HMGET, so a node
+    reached by several queries is fetched once."""
+    expanded_list = [{item['id']: item for item in initial} for initial in initial_results_list]
+    frontiers = [deque(initial) for initial in initial_results_list]
 
     for _ in range(depth):
-        if not queue:
+        candidates_list = [_frontier_candidates(frontier, expanded, graph, fan_out, decay)
+                           for frontier, expanded in zip(frontiers, expanded_list)]
+        neighbor_ids = list({nid for candidates in candidates_list for nid in candidates})
+        if not neighbor_ids:
             break
-        
-        current_node_item = queue.pop(0)
-        node_id = current_node_item['id']
 
-        if node_id in graph:
-            for neighbor_id in graph.neighbors(node_id):
-                if neighbor_id not in expanded_results:
-                    neighbor_data_bytes = r.hgetall(neighbor_id)
-                    
-                    if neighbor_data_bytes:
-                        # Decode byte data from Redis
-                        data_val = neighbor_data_bytes.get(b'data')
-                        type_val = neighbor_data_bytes.get(b'type')
-
-                        if data_val and type_val:
-                            edge_data = graph.get_edge_data(node_id, neighbor_id)
-                            original_score = current_node_item.get('score', 0.5)
-                            edge_weight = edge_data.get('score', 0.5)
-                            new_score = original_score * edge_weight * 0.9 
-
-                            neighbor_item = {
-                                "id": neighbor_id,
-                                "data": data_val.decode('utf-8'),
-                                "type": type_val.decode('utf-8'),
-                                "score": new_score
-                            }
-                            expanded_results[neighbor_id] = neighbor_item
-                            queue.append(neighbor_item)
-
-    final_list = sorted(expanded_results.values(), key=lambda x: x['score'], reverse=True)
-    return final_list[:k]
-
-
-def vector_to_bytes(vector: List[float]) -> bytes:
-    return np.array(vector, dtype=np.float32).tobytes()
\ No newline at end of file
+        pipe = r.pipeline(transaction=False)
+        for neighbor_id in neighbor_ids:
+            pipe.hmget(neighbor_id, "data", "type")
+        fetched = {}
+        for neighbor_id, (data_val, type_val) in zip(neighbor_ids, await pipe.execute()):
+            if data_val and type_val:
+                fetched[neighbor_id] = (data_val.decode('utf-8'), type_val.decode('utf-8'))
+
+        for candidates, expanded, frontier in zip(candidates_list, expanded_list, frontiers):
+            for neighbor_id, new_score in candidates.items():
+                if neighbor_id not in fetched:
+                    continue
+                data_val, type_val = fetched[neighbor_id]
+                neighbor_item = {
+                    "id": neighbor_id,
+                    "data": data_val,
+                    "type": type_val,
+                    "score": new_score
+                }
+                expanded[neighbor_id] = neighbor_item
+                frontier.append(neighbor_item)
+
+    if priors is not None:
+        for expanded, query_type in zip(expanded_list, query_types or [None] * len(expanded_list)):
+            _apply_priors(expanded, priors, query_type)
+    return [heapq.nlargest(k, expanded.values(), key=lambda x: x['score']) for expanded in expanded_list]
@@ -0,0 +1,169 @@
+import os
+import threading
+import numpy as np
+import config
+
+
+class VectorShard:
+    """Append-only float32 matrix on disk with an id sidecar.
+
+    `<path>.f32` holds the rows back to back and `<path>.ids` one
+    `key<TAB>type<TAB>seq` line per row, in the same order. Reads go through a
+    read-only np.memmap, so opening a large shard is instant and pages are
+    loaded on demand. A torn write at the end of either file (crash
+    mid-append) is truncated away on open.
+
+    `seq` is the Redis ingest sequence number (SHARD_SEQ_KEY) the row was
+    written with; comparing the highest one against Redis tells whether the
+    shard has fallen behind.
+    """
+
+    def __init__(self, path: str = config.SHARD_PATH, dim: int = config.EMBED_DIM):
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self.vec_path = f"{path}.f32"
+        self.ids_path = f"{path}.ids"
+        os.makedirs(os.path.dirname(self.vec_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+        lines = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                lines = [line[:-1] for line in f if line.endswith("\n")]
+        rows = os.path.getsize(self.vec_path) // self.row_bytes if os.path.exists(self.vec_path) else 0
+        count = min(len(lines), rows)
+        self._truncate(count, lines[:count])
+
+        self.ids: list[str] = []
+        self.index: dict[str, int] = {}
+        self._type_names: list[str] = []
+        self._type_codes: dict[str, int] = {}
+        self._row_types: list[int] = []
+        self.seq = 0
+        for line in lines[:count]:
+            key, mtype, seq = (line.split("\t") + ["", "0"])[:3]
+            self._add_row(key, mtype)
+            self.seq = max(self.seq, int(seq or 0))
+
+        self._vec_file = open(self.vec_path, "ab")
+        self._ids_file = open(self.ids_path, "a", encoding="utf-8")
+        self._matrix = None
+        self._types_array = None
+        self._mapped_rows = -1
+
+    def _truncate(self, count: int, lines: list[str]):
+        with open(self.vec_path, "ab") as f:
+            f.truncate(count * self.row_bytes)
+        with open(self.ids_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{line}\n" for line in lines)
+
+    def _type_code(self, mtype: str) -> int:
+        code = self._type_codes.get(mtype)
+        if code is None:
+            code = len(self._type_names)
+            self._type_codes[mtype] = code
+            self._type_names.append(mtype)
+        return code
+
+    def _add_row(self, key: str, mtype: str):
+        self.index[key] = len(self.ids)
+        self.ids.append(key)
+        self._row_types.append(self._type_code(mtype))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def append(self, key: str, vector, mtype: str = "", seq: int = 0) -> bool:
+        """Adds a row for `key`; returns False if it is already present."""
+        v = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if key in self.index:
+                return False
+            self._vec_file.write(v.tobytes())
+            self._vec_file.flush()
+            self._ids_file.write(f"{key}\t{mtype}\t{seq}\n")
+            self._ids_file.flush()
+            self._add_row(key, mtype)
+            self.seq = max(self.seq, seq)
+        return True
+
+    def append_many(self, keys: list[str], vectors, mtypes=None, seqs=None) -> int:
+        mtypes = mtypes or [""] * len(keys)
+        seqs = seqs or [0] * len(keys)
+        added = 0
+        for key, v, mtype, seq in zip(keys, vectors, mtypes, seqs):
+            added += self.append(key, v, mtype, seq)
+        return added
+
+    def _view(self):
+        """(matrix, row types) for every row, remapped after appends."""
+        with self._lock:
+            n = len(self.ids)
+            if self._mapped_rows != n:
+                self._matrix = (np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+                                if n else np.empty((0, self.dim), dtype=np.float32))
+                self._types_array = np.asarray(self._row_types[:n], dtype=np.int16)
+                self._mapped_rows = n
+            return self._matrix, self._types_array
+
+    def matrix(self) -> np.ndarray:
+        """(n, dim) read-only view of every row."""
+        return self._view()[0]
+
+    def get(self, key: str):
+        row = self.index.get(key)
+        return None if row is None else np.asarray(self.matrix()[row])
+
+    def get_many(self, keys: list[str]):
+        """Returns (vectors, found) for `keys`; rows for unknown keys are zero
+        and marked False in `found`."""
+        rows = np.array([self.index.get(k, -1) for k in keys], dtype=np.int64)
+        found = rows >= 0
+        out = np.zeros((len(keys), self.dim), dtype=np.float32)
+        if found.any():
+            out[found] = self.matrix()[rows[found]]
+        return out, found
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Row indices of the k highest finite scores, best first."""
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search(self, queries, k: int, query_types=None, same_k=None, cross_k=None):
+        """Exact cosine KNN for one or more normalized query vectors with a
+        single matrix product. Returns, per query, a list of (key, type,
+        score). With a query type the result holds the same_k best rows of
+        that type plus the cross_k best rows of other types (default k // 2
+        each), like the Redis TAG-filtered buckets."""
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        matrix, types = self._view()
+        if len(matrix) == 0:
+            return [[] for _ in range(len(q))]
+        scores = matrix @ q.T
+        query_types = query_types or [None] * len(q)
+
+        results = []
+        for j, query_type in enumerate(query_types):
+            s = scores[:, j]
+            if not query_type:
+                rows = self._top(s, k)
+            else:
+                same = types == self._type_codes.get(query_type, -1)
+                rows = np.concatenate([
+                    self._top(np.where(same, s, -np.inf), k // 2 if same_k is None else same_k),
+                    self._top(np.where(same, -np.inf, s), k // 2 if cross_k is None else cross_k),
+                ])
+                rows = rows[np.argsort(-s[rows])]
+            results.append([(self.ids[i], self._type_names[types[i]], float(s[i])) for i in rows.tolist()])
+        return results
+
+    def close(self):
+        self._vec_file.close()
+        self._ids_file.close()
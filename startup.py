@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Startup:
+    """Runs independent startup phases concurrently in threads and tracks
+    readiness. Each phase's wall time is recorded so slow restarts can be
+    traced to a phase; `status()` backs the /ready endpoints."""
+
+    def __init__(self, name: str = "startup"):
+        self.name = name
+        self.timings: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.total = None
+        self._ready = threading.Event()
+        self._started = None
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self, phases: dict):
+        """Starts every `name -> fn` phase in its own thread and returns
+        immediately; the service becomes ready once all of them succeed."""
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(phases,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run_phase(self, name: str, fn):
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            self.errors[name] = repr(e)
+            log.exception("[%s] phase %s failed", self.name, name)
+        self.timings[name] = time.perf_counter() - t0
+
+    def _run(self, phases: dict):
+        threads = [threading.Thread(target=self._run_phase, args=(name, fn), name=f"{self.name}-{name}", daemon=True)
+                   for name, fn in phases.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.total = time.perf_counter() - self._started
+        timings = ", ".join(f"{name}={secs:.2f}s" for name, secs in self.timings.items())
+        log.info("[%s] %s, total=%.2fs", self.name, timings, self.total)
+        if not self.errors:
+            self._ready.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "phases": {name: round(secs, 3) for name, secs in self.timings.items()},
+            "total": None if self.total is None else round(self.total, 3),
+            "errors": self.errors,
+        }
@@ -1,10 +1,12 @@
 import requests
 import os
 import shutil
+import argparse
 from urllib.parse import urlparse
 
 # --- Configuration ---
 API_URL = "http://127.0.0.1:8000/submit"
+BATCH_API_URL = "http://127.0.0.1:8000/submit_batch"
 TEMP_DOWNLOAD_DIR = "temp_image_downloads"
 
 # --- Data to Upload ---
@@ -108,10 +110,61 @@ def upload_image_from_url(session, url):
         print(f"❌ An unexpected error occurred with {url}: {e}")
 
 
+def stream_items():
+    """Yields ("text", text) and ("image", filename, bytes) items lazily, so
+    batches can be sent while later images are still downloading."""
+    for text in TEXT_DATA:
+        yield ("text", text)
+    for url in IMAGE_URLS:
+        try:
+            image_response = requests.get(url, timeout=15)
+            image_response.raise_for_status()
+            yield ("image", os.path.basename(urlparse(url).path), image_response.content)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ ERROR downloading image {url}. Reason: {e}")
+
+
+def submit_batch(session, batch):
+    """Submits one chunk of mixed items to /submit_batch."""
+    payload = [("data", item[1]) for item in batch if item[0] == "text"]
+    files = [("file", (item[1], item[2], f"image/{os.path.splitext(item[1])[1][1:]}"))
+             for item in batch if item[0] == "image"]
+    try:
+        response = session.post(BATCH_API_URL, data=payload, files=files or None, timeout=120)
+        response.raise_for_status()
+        body = response.json()
+        print(f"✅ Batch of {len(batch)}: stored {len(body.get('stored', []))}, "
+              f"duplicates {len(body.get('duplicates', []))}")
+    except requests.exceptions.RequestException as e:
+        print(f"❌ ERROR submitting batch of {len(batch)}. Reason: {e}")
+
+
+def stream_upload(batch_size):
+    """Streaming client mode: groups items into chunks of batch_size."""
+    with requests.Session() as session:
+        batch = []
+        for item in stream_items():
+            batch.append(item)
+            if len(batch) >= batch_size:
+                submit_batch(session, batch)
+                batch = []
+        if batch:
+            submit_batch(session, batch)
+    print("\n--- Batched Upload Complete ---")
+
+
 def main():
     """
     Main function to run the bulk upload process.
     """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="send items to /submit_batch in chunks of this size (0 = one /submit per item)")
+    args = parser.parse_args()
+    if args.batch_size > 0:
+        stream_upload(args.batch_size)
+        return
+
     # Create a temporary directory for downloaded images
     if not os.path.exists(TEMP_DOWNLOAD_DIR):
         os.makedirs(TEMP_DOWNLOAD_DIR)
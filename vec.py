@@ -1,44 +1,147 @@
+import base64
+import hashlib
+import logging
+import numpy as np
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class RemoteBackend:
+    """Talks to the embedding service in app.py over a pooled keep-alive
+    session, sending raw bytes and receiving binary float32 vectors."""
+
+    def __init__(self, base_url: str = config.EMBED_URL, pool_size: int = config.EMBED_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post_f32(self, path: str, **kwargs) -> np.ndarray:
+        response = self.session.post(f"{self.base_url}{path}", timeout=config.EMBED_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        dim = int(response.headers.get("X-Embedding-Dim", config.EMBED_DIM))
+        return np.frombuffer(response.content, dtype=np.float32).reshape(-1, dim)
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self._post_f32("/embed_raw", params={"type": "text"}, data=text.encode("utf-8"))[0]
+
+    def embed_image(self, image_bytes: bytes) -> np.ndarray:
+        return self._post_f32("/embed_raw", params={"type": "image"}, data=image_bytes)[0]
+
+    def embed_batch(self, texts: list[str], images: list[bytes]):
+        if not texts and not images:
+            empty = np.empty((0, config.EMBED_DIM), np.float32)
+            return empty, empty
+        body = {"texts": texts, "images": [base64.b64encode(b).decode("ascii") for b in images]}
+        embs = self._post_f32("/embed_batch", params={"format": "f32"}, json=body)
+        return embs[:len(texts)], embs[len(texts):]
+
+
+class LocalBackend:
+    """Runs CLIP (INFERENCE_BACKEND) inside the calling process, skipping the
+    HTTP hop entirely."""
+
+    def __init__(self):
+        from clip_engine import load_engine
+        self.engine = load_engine()
+        if config.MODEL_WARMUP:
+            self.engine.warmup()
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.engine.embed_texts([text])[0]
+
+    def embed_image(self, image_bytes: bytes) -> np.ndarray:
+        return self.engine.embed_images([image_bytes])[0]
+
+    def embed_batch(self, texts: list[str], images: list[bytes]):
+        empty = np.empty((0, config.EMBED_DIM), np.float32)
+        text_embs = self.engine.embed_texts(texts) if texts else empty
+        image_embs = self.engine.embed_images(images) if images else empty
+        return text_embs, image_embs
 
-url = "http://localhost:8009/embed"
-import requests
-import base64
 
+class StubBackend:
+    """Deterministic stand-in for CLIP used by the offline benchmarks: each
+    input maps to a pseudo-random unit vector seeded by its SHA-256, so the
+    same text or image always gets the same embedding."""
+
+    def __init__(self, dim: int = config.EMBED_DIM):
+        self.dim = dim
+
+    def _vector(self, data: bytes) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self._vector(text.encode("utf-8"))
+
+    def embed_image(self, image_bytes: bytes) -> np.ndarray:
+        return self._vector(image_bytes)
+
+    def embed_batch(self, texts: list[str], images: list[bytes]):
+        empty = np.empty((0, self.dim), np.float32)
+        return (np.stack([self.embed_text(t) for t in texts]) if texts else empty,
+                np.stack([self.embed_image(b) for b in images]) if images else empty)
+
+
+BACKENDS = {"remote": RemoteBackend, "local": LocalBackend, "stub": StubBackend}
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if config.EMBED_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown EMBED_BACKEND: {config.EMBED_BACKEND}")
+        _backend = BACKENDS[config.EMBED_BACKEND]()
+    return _backend
+
+
+@metrics.timed("embed")
+def toVectBatch(texts: list[str], images: list[bytes], batch_size: int = config.EMBED_MAX_BATCH):
+    """Embeds texts and images in chunks of `batch_size`; returns two float32
+    matrices aligned with the inputs."""
+    backend = get_backend()
+    text_parts, image_parts = [], []
+    for i in range(0, max(len(texts), len(images)), batch_size):
+        t, im = backend.embed_batch(texts[i:i + batch_size], images[i:i + batch_size])
+        text_parts.append(t)
+        image_parts.append(im)
+    empty = np.empty((0, config.EMBED_DIM), np.float32)
+    return (np.concatenate(text_parts) if text_parts else empty,
+            np.concatenate(image_parts) if image_parts else empty)
+
+
+@metrics.timed("embed")
 def toVect(payload):
     try:
-        # Prepare payload for the embedding API
-        api_payload = {}
+        backend = get_backend()
 
         if payload.get("type") == "text":
-            api_payload["text"] = payload["data"]
+            vector = backend.embed_text(payload["data"])
 
         elif payload.get("type") in ("image", "audio"):
-            file_path = payload["data"]
-            with open(file_path, "rb") as f:
-                file_bytes = f.read()
-            api_payload["image"] = base64.b64encode(file_bytes).decode("utf-8") \
-                if payload["type"] == "image" else base64.b64encode(file_bytes).decode("utf-8")
             # If you later add audio embedding, adjust here for audio API
+            # `data` is the raw file bytes; a path is still accepted
+            data = payload["data"]
+            if isinstance(data, str):
+                with open(data, "rb") as f:
+                    data = f.read()
+            vector = backend.embed_image(bytes(data))
 
         else:
-            print(f"Unsupported type in toVect: {payload.get('type')}")
+            log.warning("Unsupported type in toVect: %s", payload.get('type'))
             return None
 
-        # Send request to embedding API
-        response = requests.post(url, json=api_payload)
-        response.raise_for_status()
-
-        data = response.json()
-
-        if isinstance(data, list) and data:
-            vector = data[0]
-            print(f"Vector received successfully. Dimension: {len(vector)}")
-            return vector
-        else:
-            print(f"Error: Unexpected response format: {data}")
-            return None
+        log.debug("Vector received successfully. Dimension: %d", len(vector))
+        return vector
 
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        log.error("Embedding failed: %s", e)
         return None